@@ -0,0 +1,51 @@
+import time
+
+START = time.perf_counter()
+
+import importlib
+import json
+import sys
+
+# lambda_function이 쓰는 외부 패키지(boto3, botocore, pymysql) import도 cold start에 포함
+# (가짜 객체를 import 전에 넣으려면 먼저 import 해야 함, requests는 lambda_function import 시간에 포함)
+import boto3
+import pymysql
+
+DEPENDENCIES = time.perf_counter() - START
+
+# lambda_latency.py가 실행하는 cold start 측정용 프로세스
+# 새 파이썬 프로세스(= 새 Lambda 컨테이너)에서 가짜 객체를 설치하고 lambda_function import + 첫 요청 시간을 측정
+#
+#   python benchmarks/lambda_cold_start.py '{"path": "bundle", "n": 0, ...}' result.json
+#
+# harness(lambda_latency) 자체의 import 시간은 측정에서 뺌
+import lambda_latency as harness
+
+
+def main():
+    params = json.loads(sys.argv[1])
+    world = harness.FakeWorld()
+    recorder = harness.Recorder(params['latency'], params['jitter'], params['seed'])
+    services = harness.FakeServices(world, recorder)
+    with open(params['template'], encoding='utf-8') as f:
+        template = json.load(f)
+
+    services.install()
+    sys.path.insert(0, harness.LAMBDA_DIR)
+    start = time.perf_counter()
+    module = importlib.import_module('lambda_function')
+    import_seconds = time.perf_counter() - start
+    services.attach(module)
+    request_seconds = harness.invoke(module, template, params['path'], world, params['n'])
+
+    with open(sys.argv[2], 'w') as f:
+        json.dump({
+            'dependencies': DEPENDENCIES,
+            'import': import_seconds,
+            'request': request_seconds,
+            'total': DEPENDENCIES + import_seconds + request_seconds
+        }, f)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,488 @@
+import argparse
+import copy
+import functools
+import importlib
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import boto3
+import pymysql
+
+# 챗봇 lambda_handler 지연 시간 측정 harness
+# Spotify / MySQL / DynamoDB / Lambda 호출을 로컬 가짜 객체로 바꾸고, 호출마다 지정한 지연 시간을 넣어서 실행
+#
+#   python benchmarks/lambda_latency.py --requests 200 --latency spotify=150 mysql=5 dynamodb=10 lambda=40
+#
+# 경로별(new_artist / known_no_related / known_related / bundle) p50, p95, p99,
+# 하위 호출별 p50, p95, p99, cold start와 warm 요청 시간을 출력
+# cold start는 요청마다 새 파이썬 프로세스(lambda_cold_start.py)에서
+# 외부 패키지 import + lambda_function import + 첫 요청 시간을 측정 (인터프리터 시작 시간은 제외)
+# 요청 body는 녹화한 카카오 스킬 요청(kakao_request.json)의 utterance만 바꿔서 사용
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), 'lambda', 'chatbot')
+LAMBDA_MODULES = ['lambda_function', 'artist_cache', 'kakao_message', 'spotify_api', 'tracing']
+COLD_START_SCRIPT = os.path.join(BENCHMARK_DIR, 'lambda_cold_start.py')
+
+PATHS = ['new_artist', 'known_no_related', 'known_related', 'bundle']
+
+# 서비스별 기본 지연 시간 (ms)
+LATENCY = {'spotify': 150, 'mysql': 5, 'dynamodb': 10, 'lambda': 40, 'connect': 50}
+
+# 카카오 스킬 응답 제한 시간 (ms)
+BUDGET_MS = 5000
+
+CONFIG_INI = """[API]
+client_id = local
+client_secret = local
+
+[DB]
+host = localhost
+user = local
+password = local
+database = local
+port = 3306
+"""
+
+ARTIST_COLUMNS = ['artist_id', 'artist_name', 'followers', 'popularity', 'artist_url', 'image_url']
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summary(values):
+    return {
+        'count': len(values),
+        'p50_ms': round(percentile(values, 50) * 1000, 2) if values else None,
+        'p95_ms': round(percentile(values, 95) * 1000, 2) if values else None,
+        'p99_ms': round(percentile(values, 99) * 1000, 2) if values else None,
+        'max_ms': round(max(values) * 1000, 2) if values else None
+    }
+
+
+# 하위 호출 시간 기록: 서비스별 평균 지연에 +-jitter 비율만큼 흔들어서 sleep
+class Recorder:
+    def __init__(self, latency, jitter=0.3, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.calls = defaultdict(list)
+
+    def call(self, name, service):
+        start = time.perf_counter()
+        ms = self.latency.get(service, 0)
+        if ms > 0:
+            time.sleep(ms * (1 + self.rng.uniform(-self.jitter, self.jitter)) / 1000)
+        self.calls[name].append(time.perf_counter() - start)
+
+
+# 가짜 데이터: artists 테이블, related_artists, artist_tracks, artist_bundles
+class FakeWorld:
+    def __init__(self, known=30):
+        self.artists = {}
+        self.related = defaultdict(list)
+        self.tracks = {}
+        self.bundles = {}
+        self.new_count = 0
+
+        for i in range(known):
+            self.add_artist(self.spotify_artist('known artist {}'.format(i)))
+
+        # 절반은 관련 아티스트 3명, 나머지는 관련 아티스트 없음
+        ids = list(self.artists)
+        self.with_related = ids[:known // 2]
+        self.without_related = ids[known // 2:]
+        for n, artist_id in enumerate(self.with_related):
+            self.related[artist_id] = [ids[(n + j) % len(ids)] for j in range(1, 4)]
+
+        # 번들은 관련 아티스트가 있는 아티스트와 같은 응답을 미리 만들어 둔 것으로 취급
+        self.bundled = ['bundled artist {}'.format(i) for i in range(known // 2)]
+        for name in self.bundled:
+            artist = self.spotify_artist(name)
+            self.add_artist(artist)
+            self.bundles[artist['artist_id']] = {
+                'artist_id': artist['artist_id'], 'dt': time.strftime('%Y-%m-%d', time.gmtime()),
+                'version': 1, 'body': json.dumps({'version': '2.0', 'template': {'outputs': []}})
+            }
+
+    @staticmethod
+    def artist_id(name):
+        return 'id-' + name.replace(' ', '-')
+
+    def spotify_artist(self, name):
+        return {
+            'artist_id': self.artist_id(name), 'artist_name': name, 'followers': 1000, 'popularity': 50,
+            'artist_url': 'https://open.spotify.com/artist/' + self.artist_id(name),
+            'image_url': 'https://i.scdn.co/image/' + self.artist_id(name)
+        }
+
+    def add_artist(self, artist):
+        self.artists[artist['artist_id']] = artist
+        self.tracks[artist['artist_id']] = [{
+            'artist_id': artist['artist_id'], 'track_id': '{}-{}'.format(artist['artist_id'], t),
+            'track_name': 'track {}'.format(t), 'album_name': 'album', 'popularity': 100 - t,
+            'image_url': 'https://i.scdn.co/image/album'
+        } for t in range(10)]
+
+    def new_artist_name(self):
+        self.new_count += 1
+        return 'new artist {}'.format(self.new_count)
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+        self.headers = {}
+        self.text = json.dumps(data)
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+# Spotify Web API (search, artists/{id}/top-tracks)
+class FakeSpotifySession:
+    def __init__(self, world, recorder):
+        self.world = world
+        self.recorder = recorder
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        if url.endswith('/search'):
+            self.recorder.call('spotify.search', 'spotify')
+            artist = self.world.spotify_artist(params['q'])
+            return FakeResponse({'artists': {'items': [{
+                'id': artist['artist_id'], 'name': artist['artist_name'],
+                'followers': {'total': artist['followers']}, 'popularity': artist['popularity'],
+                'external_urls': {'spotify': artist['artist_url']}, 'images': [{'url': artist['image_url']}]
+            }]}})
+
+        self.recorder.call('spotify.top_tracks', 'spotify')
+        return FakeResponse({'tracks': [{
+            'id': 'track{}'.format(t), 'name': 'track {}'.format(t), 'popularity': 100 - t,
+            'album': {'name': 'album', 'images': [{'url': 'https://i.scdn.co/640'}, {'url': 'https://i.scdn.co/300'}]}
+        } for t in range(10)]})
+
+
+class FakeCursor:
+    def __init__(self, world, recorder):
+        self.world = world
+        self.recorder = recorder
+        self.description = None
+        self._rows = []
+
+    def execute(self, sql, args=None):
+        sql = ' '.join(sql.lower().split())
+        rows = []
+        if sql.startswith('insert into artists'):
+            self.recorder.call('mysql.insert_artist', 'mysql')
+            self.world.add_artist(dict(zip(ARTIST_COLUMNS, args)))
+        elif 'from related_artists' in sql:
+            self.recorder.call('mysql.related_artists', 'mysql')
+            artist_id, limit = args
+            rows = [self.world.artists[r] for r in self.world.related[artist_id][:limit]]
+        elif 'from artists where artist_id' in sql:
+            self.recorder.call('mysql.get_artist', 'mysql')
+            rows = [self.world.artists[args[0]]] if args[0] in self.world.artists else []
+        elif 'from artists where artist_name' in sql:
+            self.recorder.call('mysql.get_artist_by_name', 'mysql')
+            rows = [a for a in self.world.artists.values() if a['artist_name'] == args[0]]
+        else:
+            self.recorder.call('mysql.other', 'mysql')
+
+        self.description = [(c,) for c in ARTIST_COLUMNS]
+        self._rows = [tuple(row[c] for c in ARTIST_COLUMNS) for row in rows]
+        return len(self._rows)
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeConnection:
+    def __init__(self, world, recorder):
+        self.world = world
+        self.recorder = recorder
+        self.open = True
+        self.recorder.call('mysql.connect', 'connect')
+
+    def cursor(self):
+        return FakeCursor(self.world, self.recorder)
+
+    def commit(self):
+        self.recorder.call('mysql.commit', 'mysql')
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=True):
+        self.recorder.call('mysql.ping', 'mysql')
+
+    def close(self):
+        self.open = False
+
+
+class FakeDynamoClient:
+    def __init__(self, world, recorder):
+        self.world = world
+        self.recorder = recorder
+
+    def query(self, TableName, KeyConditionExpression, **kwargs):
+        self.recorder.call('dynamodb.query', 'dynamodb')
+        artist_id = KeyConditionExpression.get_expression()['values'][1]
+        return {'Items': list(self.world.tracks.get(artist_id, []))}
+
+    def get_item(self, TableName, Key, **kwargs):
+        self.recorder.call('dynamodb.get_item', 'dynamodb')
+        item = self.world.bundles.get(Key['artist_id']) if TableName == 'artist_bundles' else None
+        return {'Item': item} if item else {}
+
+
+class FakeMeta:
+    def __init__(self, client):
+        self.client = client
+
+
+class FakeDynamoResource:
+    def __init__(self, world, recorder):
+        self.meta = FakeMeta(FakeDynamoClient(world, recorder))
+
+
+class FakeLambdaClient:
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def invoke(self, **kwargs):
+        self.recorder.call('lambda.invoke', 'lambda')
+        return {'StatusCode': 202}
+
+
+# pymysql / boto3 / Spotify 토큰 발급을 가짜 객체로 바꿈 (restore로 되돌림)
+class FakeServices:
+    def __init__(self, world, recorder):
+        self.world = world
+        self.recorder = recorder
+        self._saved = None
+
+    def install(self):
+        self._saved = (pymysql.connect, boto3.resource, boto3.client)
+        pymysql.connect = lambda *args, **kwargs: FakeConnection(self.world, self.recorder)
+        boto3.resource = self.resource
+        boto3.client = self.client
+
+    def restore(self):
+        pymysql.connect, boto3.resource, boto3.client = self._saved
+
+    def resource(self, name, *args, **kwargs):
+        if name == 'dynamodb':
+            return FakeDynamoResource(self.world, self.recorder)
+        raise ValueError('no fake resource for {}'.format(name))
+
+    def client(self, name, *args, **kwargs):
+        if name == 'lambda':
+            return FakeLambdaClient(self.recorder)
+        if name == 'dynamodb':
+            return FakeDynamoClient(self.world, self.recorder)
+        raise ValueError('no fake client for {}'.format(name))
+
+    # import된 lambda_function 모듈의 Spotify 호출을 가짜 세션으로 연결
+    # Spotify 클라이언트는 처음 사용할 때 만들어지므로 get_spotify를 감싸서 만들어진 직후에 연결
+    def attach(self, module):
+        recorder = self.recorder
+        get_spotify = module.get_spotify
+
+        def request_token():
+            recorder.call('spotify.token', 'spotify')
+            return 'local-token', time.monotonic() + 3600
+
+        @functools.lru_cache(maxsize=None)
+        def fake_spotify():
+            spotify = get_spotify()
+            spotify.auth._request_token = request_token
+            spotify.session = FakeSpotifySession(self.world, recorder)
+            return spotify
+
+        module.get_spotify = fake_spotify
+
+
+# lambda_function을 새로 import (warm 요청용, 외부 패키지는 이미 import된 상태)
+def load_handler(services):
+    for name in LAMBDA_MODULES:
+        sys.modules.pop(name, None)
+    module = importlib.import_module('lambda_function')
+    services.attach(module)
+    return module
+
+
+# 새 파이썬 프로세스에서 cold start 한 번 측정 (workdir의 config.ini 사용)
+def cold_start(workdir, template_path, path, n, latency, jitter, seed):
+    params = {'path': path, 'n': n, 'latency': latency, 'jitter': jitter, 'seed': seed + n,
+              'template': template_path}
+    output = os.path.join(workdir, 'cold-{}.json'.format(n))
+    subprocess.run([sys.executable, COLD_START_SCRIPT, json.dumps(params), output],
+                   cwd=workdir, check=True, stdout=subprocess.DEVNULL)
+    with open(output) as f:
+        return json.load(f)
+
+
+def kakao_event(template, utterance):
+    body = copy.deepcopy(template)
+    body['userRequest']['utterance'] = utterance + '\n'
+    return {'body': json.dumps(body)}
+
+
+def utterance_for(path, world, n):
+    if path == 'new_artist':
+        return world.new_artist_name()
+    if path == 'known_no_related':
+        return world.artists[world.without_related[n % len(world.without_related)]]['artist_name']
+    if path == 'known_related':
+        return world.artists[world.with_related[n % len(world.with_related)]]['artist_name']
+    return world.bundled[n % len(world.bundled)]
+
+
+def invoke(module, template, path, world, n):
+    event = kakao_event(template, utterance_for(path, world, n))
+    start = time.perf_counter()
+    result = module.lambda_handler(event, None)
+    seconds = time.perf_counter() - start
+    if result is None or result['statusCode'] != 200:
+        raise RuntimeError('{} request failed: {}'.format(path, result))
+    return seconds
+
+
+def run(requests=100, cold_starts=5, paths=PATHS, latency=LATENCY, jitter=0.3, seed=0, clear_cache=False,
+        template_path=os.path.join(BENCHMARK_DIR, 'kakao_request.json')):
+    with open(template_path, encoding='utf-8') as f:
+        template = json.load(f)
+
+    world = FakeWorld()
+    recorder = Recorder(latency, jitter, seed)
+    services = FakeServices(world, recorder)
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix='lambda-latency-')
+    with open(os.path.join(workdir, 'config.ini'), 'w', encoding='utf-8') as f:
+        f.write(CONFIG_INI)
+
+    sys.path.insert(0, LAMBDA_DIR)
+    os.chdir(workdir)  # lambda_function은 현재 폴더의 config.ini를 읽음
+    services.install()
+    try:
+        # cold start: 새 컨테이너처럼 새 프로세스에서 import하고 첫 요청 실행
+        cold = defaultdict(list)
+        stages = defaultdict(list)
+        for n in range(cold_starts):
+            path = paths[n % len(paths)]
+            result = cold_start(workdir, os.path.abspath(template_path), path, n, latency, jitter, seed)
+            for stage in ('dependencies', 'import', 'request'):
+                stages[stage].append(result[stage])
+            cold[path].append(result['total'])
+
+        # warm: 같은 모듈(컨테이너)로 경로를 번갈아 가며 요청
+        module = load_handler(services)
+        recorder.calls.clear()
+        warm = defaultdict(list)
+        for n in range(requests):
+            for path in paths:
+                if clear_cache:
+                    module.get_artist_cache().found.clear()
+                    module.get_artist_cache().not_found.clear()
+                warm[path].append(invoke(module, template, path, world, n))
+    finally:
+        services.restore()
+        os.chdir(cwd)
+        sys.path.remove(LAMBDA_DIR)
+        for name in LAMBDA_MODULES:
+            sys.modules.pop(name, None)
+
+    return {
+        'params': {'requests': requests, 'cold_starts': cold_starts, 'paths': paths, 'latency_ms': latency,
+                   'jitter': jitter, 'seed': seed, 'clear_cache': clear_cache},
+        'cold_stages': {stage: summary(values) for stage, values in stages.items()},
+        'cold': {path: summary(values) for path, values in cold.items()},
+        'warm': {path: summary(values) for path, values in warm.items()},
+        'over_budget': {path: sum(v * 1000 > BUDGET_MS for v in values) for path, values in warm.items()},
+        'calls': {name: summary(values) for name, values in sorted(recorder.calls.items())}
+    }
+
+
+def print_table(title, rows):
+    print(title)
+    print('  {:<28} {:>7} {:>10} {:>10} {:>10}'.format('', 'count', 'p50(ms)', 'p95(ms)', 'p99(ms)'))
+    for name, s in rows.items():
+        print('  {:<28} {count:>7} {p50_ms:>10} {p95_ms:>10} {p99_ms:>10}'.format(name, **s))
+
+
+# "spotify=150 mysql=5" -> {'spotify': 150.0, 'mysql': 5.0}
+def parse_latency(values):
+    latency = dict(LATENCY)
+    for value in values:
+        service, ms = value.split('=', 1)
+        latency[service] = float(ms)
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description='chatbot lambda_handler latency harness')
+    parser.add_argument('--requests', type=int, default=100, help='경로별 warm 요청 수')
+    parser.add_argument('--cold-starts', type=int, default=8)
+    parser.add_argument('--paths', nargs='+', choices=PATHS, default=PATHS)
+    parser.add_argument('--latency', nargs='*', default=[], metavar='SERVICE=MS',
+                        help='서비스별 평균 지연 (spotify, mysql, dynamodb, lambda, connect)')
+    parser.add_argument('--jitter', type=float, default=0.3, help='지연 시간을 평균의 +-비율만큼 흔듦')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--clear-cache', action='store_true', help='요청마다 아티스트 검색 캐시를 비움')
+    parser.add_argument('--template', default=os.path.join(BENCHMARK_DIR, 'kakao_request.json'))
+    parser.add_argument('--tracing', action='store_true', help='lambda의 EMF 로그 출력을 켬 (기본값: 끔)')
+    parser.add_argument('--output', help='결과 JSON 파일')
+    args = parser.parse_args()
+
+    # tracing은 import 시점에 환경 변수로 켜고 끔
+    os.environ['TRACING'] = 'on' if args.tracing else 'off'
+
+    results = run(requests=args.requests, cold_starts=args.cold_starts, paths=args.paths,
+                  latency=parse_latency(args.latency), jitter=args.jitter, seed=args.seed,
+                  clear_cache=args.clear_cache, template_path=args.template)
+
+    print_table('cold start stages (fresh process)', results['cold_stages'])
+    print_table('cold start (dependencies + import + first request)', results['cold'])
+    print_table('warm requests', results['warm'])
+    print_table('downstream calls (warm)', results['calls'])
+    print('over {}ms budget: {}'.format(BUDGET_MS, results['over_budget']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('results written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
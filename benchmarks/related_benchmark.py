@@ -0,0 +1,150 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+# 관련 아티스트 계산 모듈은 Airflow dags 폴더에 있음
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dags'))
+from related_distance import METRICS, FeatureTable, nearest_artists
+from related_index import NeighbourIndex
+from related_parallel import parallel_nearest_artists
+
+# 관련 아티스트 계산 단계(거리 계산 + top-k) 벤치마크
+# AWS / MySQL 없이 고정 seed의 가상 아티스트 feature 테이블로 실행
+#
+#   python benchmarks/related_benchmark.py --sizes 1000 10000 100000 --output results.json
+#
+# 크기, 방법별로 실행 시간, 최대 메모리(tracemalloc, 메인 프로세스), 초당 처리 아티스트 수를 출력하고
+# 일부 아티스트의 결과를 기존 구현(이중 루프 + 정렬)과 비교해 일치율을 남김
+
+SIZES = [1000, 5000, 10000, 50000, 100000]
+METHODS = ['exact', 'parallel', 'index']
+
+
+# 가상 아티스트 feature 테이블 (실제 데이터처럼 수치마다 범위가 다르고, 중복 값이 조금 있도록 반올림)
+def synthetic_table(n, seed=0):
+    rng = np.random.default_rng(seed)
+    low = np.array([0.1, 0.0, -30.0, 0.02, 0.0, 0.0])
+    high = np.array([0.95, 1.0, -2.0, 0.6, 1.0, 0.9])
+    values = np.round(low + rng.random((n, len(METRICS))) * (high - low), 4)
+    ids = ['artist{:07d}'.format(i) for i in range(n)]
+    return FeatureTable(ids, values, values.min(axis=0), values.max(axis=0))
+
+
+# 기존 related_artists.py의 계산 방식 그대로 아티스트 한 명의 관련 아티스트 5명
+def reference_related(table, i, k=5):
+    x_min, x_max = table.bounds
+    mine = table.values[i]
+    data = []
+    for j in range(len(table)):
+        if j == i:
+            continue
+        dist = 0
+        for m in range(len(table.metrics)):
+            x_norm = (float(mine[m]) - x_min[m]) / (x_max[m] - x_min[m])
+            y_norm = (float(table.values[j][m]) - x_min[m]) / (x_max[m] - x_min[m])
+            dist += math.sqrt((x_norm - y_norm) ** 2)
+        if dist != 0:
+            data.append((table.ids[j], dist))
+    return sorted(data, key=lambda x: x[1])[:k]
+
+
+def run_method(method, table, k, workers, memory_limit_mb, eps):
+    if method == 'exact':
+        return nearest_artists(table.ids, table.features, k=k)
+    if method == 'parallel':
+        return parallel_nearest_artists(table.ids, table.features, k=k, workers=workers,
+                                        memory_limit=memory_limit_mb << 20)
+    if method == 'index':
+        return NeighbourIndex(table.ids, table.features).nearest_artists(k=k, eps=eps)
+    raise ValueError('unknown method: {}'.format(method))
+
+
+# 샘플 아티스트 중 기존 구현과 관련 아티스트 목록(순서 포함)이 같은 비율
+def match_rate(table, related_data, rows, k):
+    matched = 0
+    for i in rows:
+        expected = [artist_id for artist_id, _ in reference_related(table, i, k)]
+        actual = [row['related_artist_id'] for row in related_data[i]]
+        matched += expected == actual
+    return matched / len(rows)
+
+
+def benchmark(sizes, methods, seed=0, k=5, sample=20, workers=0, memory_limit_mb=512, eps=0.0):
+    results = []
+    for n in sizes:
+        table = synthetic_table(n, seed)
+        table.features  # 정규화는 계산 시간에서 제외
+        rows = np.sort(np.random.default_rng(seed).choice(n, size=min(sample, n), replace=False))
+
+        for method in methods:
+            tracemalloc.start()
+            start = time.perf_counter()
+            related_data = run_method(method, table, k, workers, memory_limit_mb, eps)
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            result = {
+                'artists': n,
+                'method': method,
+                'seconds': round(seconds, 4),
+                'peak_mb': round(peak / 2 ** 20, 1),
+                'artists_per_second': round(n / seconds, 1) if seconds > 0 else None,
+                'match_rate': match_rate(table, related_data, rows, k) if sample > 0 else None
+            }
+            print('{artists:>7} {method:<8} {seconds:>9.3f}s {peak_mb:>8.1f}MB '
+                  '{artists_per_second:>12.1f}/s match={match_rate}'.format(**result))
+            results.append(result)
+            del related_data
+
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='related artist distance / top-k benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=METHODS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--sample', type=int, default=20, help='기존 구현과 비교할 아티스트 수 (0이면 비교 안 함)')
+    parser.add_argument('--workers', type=int, default=0, help='parallel 방법의 프로세스 수 (0이면 CPU 수)')
+    parser.add_argument('--memory-limit-mb', type=int, default=512)
+    parser.add_argument('--eps', type=float, default=0.0, help='index 방법의 근사 검색 정도')
+    parser.add_argument('--output', default='related_benchmark.json')
+    args = parser.parse_args()
+
+    results = benchmark(args.sizes, args.methods, seed=args.seed, k=args.k, sample=args.sample,
+                        workers=args.workers, memory_limit_mb=args.memory_limit_mb, eps=args.eps)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'commit': git_commit(),
+            'created_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'cpus': os.cpu_count(),
+            'params': vars(args),
+            'results': results
+        }, f, indent=2)
+    print('results written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import codecs
+import csv
+import logging
+import time
+from urllib.parse import urlparse
+
+import boto3
+
+# 더 이상 바뀌지 않는 쿼리 상태
+TERMINAL_STATES = ('SUCCEEDED', 'FAILED', 'CANCELLED')
+
+
+# Athena 컬럼 타입별 값 변환 (목록에 없는 타입은 문자열 그대로)
+CONVERTERS = {
+    'boolean': lambda v: v == 'true',
+    'tinyint': int,
+    'smallint': int,
+    'integer': int,
+    'bigint': int,
+    'float': float,
+    'real': float,
+    'double': float,
+    'decimal': float
+}
+
+
+# ResultSetMetadata의 ColumnInfo -> [(컬럼 이름, 변환 함수), ...]
+def column_converters(column_info):
+    return [(col['Name'], CONVERTERS.get(col['Type'], str)) for col in column_info]
+
+
+# 값 하나 변환 (NULL이면 None)
+def convert(converter, value):
+    if value is None:
+        return None
+    return converter(value)
+
+
+class AthenaQueryError(Exception):
+    def __init__(self, query_id, state, reason):
+        super().__init__('athena query {} {}: {}'.format(query_id, state, reason))
+        self.query_id = query_id
+        self.state = state
+        self.reason = reason
+
+
+# Athena 쿼리 실행기
+# - 상태 확인 간격을 poll_initial에서 시작해 poll_max까지 2배씩 늘림 (짧은 쿼리는 빨리, 긴 쿼리는 API 호출을 적게)
+# - timeout(초) 안에 끝나지 않으면 쿼리를 취소하고 TimeoutError
+# - FAILED / CANCELLED 는 AthenaQueryError
+# - run_all: 여러 쿼리를 한 번에 제출하고 모두 끝날 때까지 대기 (가장 느린 쿼리 시간만큼 걸림)
+# - rows: 결과를 한 페이지(최대 1000행)씩 읽어 타입 변환된 dict로 하나씩 리턴
+#   read_csv = True 이면 get_query_results 대신 S3의 결과 CSV 파일을 바로 스트리밍 (결과가 아주 클 때)
+class AthenaRunner:
+    def __init__(self, athena, database, output_location, poll_initial=0.2, poll_max=5, timeout=900,
+                 read_csv=False):
+        self.athena = athena
+        self.database = database
+        self.output_location = output_location
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.timeout = timeout
+        self.read_csv = read_csv
+        self.executions = {}  # 완료된 쿼리의 QueryExecution (통계 확인용)
+
+    def start(self, query):
+        response = self.athena.start_query_execution(
+            QueryString=query,
+            QueryExecutionContext={
+                'Database': self.database
+            },
+            ResultConfiguration={
+                # 쿼리 결과 저장하는 위치 지정
+                'OutputLocation': self.output_location,
+                'EncryptionConfiguration': {
+                    'EncryptionOption': 'SSE_S3'
+                }
+            }
+        )
+        return response['QueryExecutionId']
+
+    # 쿼리들이 모두 끝날 때까지 대기 후 QueryExecution 목록 리턴 (query_ids 순서)
+    def wait_all(self, query_ids):
+        query_ids = list(query_ids)
+        executions = {}
+        deadline = time.monotonic() + self.timeout
+        interval = self.poll_initial
+
+        while True:
+            pending = [q for q in query_ids if q not in executions]
+            # batch_get_query_execution은 한 번에 50개까지
+            for i in range(0, len(pending), 50):
+                response = self.athena.batch_get_query_execution(QueryExecutionIds=pending[i:i + 50])
+                for execution in response['QueryExecutions']:
+                    if execution['Status']['State'] in TERMINAL_STATES:
+                        executions[execution['QueryExecutionId']] = execution
+                        self.executions[execution['QueryExecutionId']] = execution
+
+            if len(executions) == len(query_ids):
+                break
+
+            if time.monotonic() + interval > deadline:
+                for q in query_ids:
+                    if q not in executions:
+                        self.athena.stop_query_execution(QueryExecutionId=q)
+                raise TimeoutError('athena queries did not finish in {}s: {}'.format(
+                    self.timeout, [q for q in query_ids if q not in executions]))
+
+            time.sleep(interval)
+            interval = min(interval * 2, self.poll_max)
+
+        for q in query_ids:
+            status = executions[q]['Status']
+            if status['State'] != 'SUCCEEDED':
+                logging.error('QUERY {}'.format(status['State']))
+                raise AthenaQueryError(q, status['State'], status.get('StateChangeReason', ''))
+
+        return [executions[q] for q in query_ids]
+
+    def wait(self, query_id):
+        return self.wait_all([query_id])[0]
+
+    # 쿼리 하나 실행 후 완료까지 대기, QueryExecutionId 리턴
+    def run(self, query):
+        query_id = self.start(query)
+        self.wait(query_id)
+        return query_id
+
+    # 여러 쿼리를 동시에 실행 후 모두 완료까지 대기, QueryExecutionId 목록 리턴
+    def run_all(self, queries):
+        query_ids = [self.start(query) for query in queries]
+        self.wait_all(query_ids)
+        return query_ids
+
+    # 완료된 쿼리들의 대기(queue) / 실행 시간, 읽은 데이터 크기 합
+    def statistics(self, query_ids):
+        totals = {'queries': 0, 'queue_ms': 0, 'engine_ms': 0, 'total_ms': 0, 'scanned_bytes': 0}
+        for q in query_ids:
+            stats = self.executions.get(q, {}).get('Statistics', {})
+            totals['queries'] += 1
+            totals['queue_ms'] += stats.get('QueryQueueTimeInMillis', 0)
+            totals['engine_ms'] += stats.get('EngineExecutionTimeInMillis', 0)
+            totals['total_ms'] += stats.get('TotalExecutionTimeInMillis', 0)
+            totals['scanned_bytes'] += stats.get('DataScannedInBytes', 0)
+        return totals
+
+    # 완료된 쿼리 결과를 한 행씩 dict({컬럼: 값})로 리턴
+    def rows(self, query_id):
+        if self.read_csv:
+            return self.iter_csv_rows(query_id)
+        return self.iter_rows(query_id)
+
+    # get_query_results를 NextToken이 없을 때까지 따라가며 읽음 (메모리에는 한 페이지만 유지)
+    def iter_rows(self, query_id, page_size=1000):
+        kwargs = {'QueryExecutionId': str(query_id), 'MaxResults': page_size}  # Athena는 MaxResults가 1000
+        converters = None
+
+        while True:
+            response = self.athena.get_query_results(**kwargs)
+            rows = response['ResultSet']['Rows']
+
+            # 첫 페이지의 첫 행은 컬럼 이름
+            if converters is None:
+                converters = column_converters(response['ResultSet']['ResultSetMetadata']['ColumnInfo'])
+                rows = rows[1:]
+
+            for row in rows:
+                yield {name: convert(converter, col.get('VarCharValue'))
+                       for (name, converter), col in zip(converters, row['Data'])}
+
+            if 'NextToken' not in response:
+                break
+            kwargs['NextToken'] = response['NextToken']
+
+    # S3 OutputLocation의 결과 CSV 파일을 스트리밍으로 읽음
+    # 컬럼 타입은 첫 페이지(1행)의 ResultSetMetadata로 확인, 빈 값은 NULL로 처리
+    def iter_csv_rows(self, query_id):
+        response = self.athena.get_query_results(QueryExecutionId=str(query_id), MaxResults=1)
+        converters = dict(column_converters(response['ResultSet']['ResultSetMetadata']['ColumnInfo']))
+
+        execution = self.athena.get_query_execution(QueryExecutionId=str(query_id))['QueryExecution']
+        location = urlparse(execution['ResultConfiguration']['OutputLocation'])
+        body = boto3.client('s3').get_object(Bucket=location.netloc, Key=location.path.lstrip('/'))['Body']
+
+        try:
+            for row in csv.DictReader(codecs.getreader('utf-8')(body)):
+                yield {name: convert(converters[name], value if value != '' else None) for name, value in row.items()}
+        finally:
+            body.close()
@@ -0,0 +1,76 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+
+# segment 하나가 끝났다는 표시 (error: 실패한 경우 예외)
+class _SegmentDone:
+    def __init__(self, error=None):
+        self.error = error
+
+
+# stop 되기 전까지 큐에 넣음 (소비하는 쪽이 중간에 멈추면 False)
+def _put(out, stop, value):
+    while not stop.is_set():
+        try:
+            out.put(value, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+# segment 하나를 LastEvaluatedKey가 없을 때까지 읽어서 페이지 단위로 큐에 넣음
+# boto3 resource는 스레드 간에 공유하면 안 되므로 스레드마다 session을 따로 만듦
+def _scan_segment(table_name, segment, total_segments, kwargs, out, stop):
+    try:
+        table = boto3.session.Session().resource('dynamodb').Table(table_name)
+        kwargs = dict(kwargs)
+        if total_segments > 1:
+            kwargs.update(Segment=segment, TotalSegments=total_segments)
+
+        while not stop.is_set():
+            response = table.scan(**kwargs)
+            if not _put(out, stop, response['Items']):
+                return
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    except Exception as e:
+        _put(out, stop, _SegmentDone(e))
+    else:
+        _put(out, stop, _SegmentDone())
+
+
+# DynamoDB 테이블 전체 아이템 (LastEvaluatedKey를 따라 모든 페이지를 읽음)
+# - segments > 1 이면 parallel scan (Segment / TotalSegments)으로 segment마다 스레드 하나씩 동시에 읽음
+# - projection: 필요한 속성만 읽음 (예: 'artist_id, track_id')
+# - 읽은 페이지부터 바로 하나씩 리턴 (큐 크기만큼만 메모리에 쌓임, 순서는 보장하지 않음)
+# - 나머지 kwargs는 table.scan에 그대로 전달 (FilterExpression, ExpressionAttributeNames, Limit 등)
+def scan_items(table_name, segments=1, projection=None, **kwargs):
+    if projection:
+        kwargs['ProjectionExpression'] = projection
+
+    out = queue.Queue(maxsize=segments * 2)
+    stop = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=segments) as executor:
+        for segment in range(segments):
+            executor.submit(_scan_segment, table_name, segment, segments, kwargs, out, stop)
+
+        try:
+            done = 0
+            while done < segments:
+                page = out.get()
+                if isinstance(page, _SegmentDone):
+                    if page.error is not None:
+                        raise page.error
+                    done += 1
+                    continue
+                for item in page:
+                    yield item
+        finally:
+            # 에러 또는 소비하는 쪽이 중간에 멈춘 경우 나머지 segment도 멈춤
+            stop.set()
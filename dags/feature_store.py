@@ -0,0 +1,84 @@
+import os
+
+import boto3
+import botocore
+import pandas as pd
+
+# 실행 사이에 유지하는 audio feature 저장소 위치 (S3)
+# audio-features/ 아래에 두면 Athena 테이블 위치와 섞이므로 따로 둠
+FEATURE_STORE_KEY = 'feature-store/audio_features.parquet'
+
+
+# track_id별 audio feature 저장소
+# 한 트랙의 audio feature는 바뀌지 않으므로, 이미 받은 트랙은 다시 API를 호출하지 않음
+# - missing: 저장소에 없는 track id만 중복 없이 리턴 (이 id들만 API 호출)
+# - add: API 결과 추가 (Spotify가 찾지 못한 트랙은 null이므로 건너뜀, 다음 실행에서 다시 시도)
+# - select: 요청한 track id의 feature를 track id 하나에 한 행씩 DataFrame으로 리턴
+class AudioFeatureStore:
+    def __init__(self, frame=None):
+        self.frame = frame if frame is not None else pd.DataFrame()
+        self._ids = set(self.frame['id']) if 'id' in self.frame else set()
+        self._new = []
+        self._indexed = None  # select용 id 인덱스 (frame이 바뀌면 다시 만듦)
+        self.added = 0  # 이번 실행에서 추가된 트랙 수
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls()
+        return cls(pd.read_parquet(path, engine="pyarrow"))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, track_id):
+        return track_id in self._ids
+
+    def missing(self, track_ids):
+        return [t for t in dict.fromkeys(track_ids) if t not in self._ids]
+
+    def add(self, features):
+        for feature in features:
+            if not feature or feature['id'] in self._ids:
+                continue
+            self._ids.add(feature['id'])
+            self._new.append(feature)
+            self.added += 1
+
+    # add로 모은 행을 DataFrame에 한 번에 합침 (행마다 concat 하지 않도록)
+    def _merge(self):
+        if self._new:
+            self.frame = pd.concat([self.frame, pd.DataFrame(self._new)], ignore_index=True)
+            self._new = []
+            self._indexed = None
+
+    def select(self, track_ids):
+        self._merge()
+        if 'id' not in self.frame:
+            return pd.DataFrame()
+        if self._indexed is None:
+            self._indexed = self.frame.drop_duplicates('id').set_index('id', drop=False)
+        return self._indexed.loc[[t for t in dict.fromkeys(track_ids) if t in self._ids]].reset_index(drop=True)
+
+    def save(self, path):
+        self._merge()
+        self.frame.to_parquet(path, engine="pyarrow", compression="snappy", index=False)
+
+
+# S3의 저장소를 path로 받아서 불러오기 (처음 실행이면 빈 저장소)
+def download_store(bucket, path, key=FEATURE_STORE_KEY):
+    try:
+        boto3.client('s3').download_file(bucket, key, path)
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            return AudioFeatureStore()
+        raise
+    return AudioFeatureStore.load(path)
+
+
+# 새로 추가된 트랙이 있을 때만 저장 후 S3에 올림
+def upload_store(store, bucket, path, key=FEATURE_STORE_KEY):
+    if not store.added:
+        return
+    store.save(path)
+    boto3.client('s3').upload_file(path, bucket, key)
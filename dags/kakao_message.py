@@ -0,0 +1,176 @@
+from urllib import parse
+
+# 카카오 챗봇 응답 메시지 생성 함수
+# lambda/chatbot/kakao_message.py 는 이 파일의 심볼릭 링크 (챗봇 Lambda와 파이프라인이 같은 형식으로 응답을 만듦)
+
+# 응답 번들 형식 버전: 메시지 형식이 바뀌면 올려서, 이전에 만든 번들을 쓰지 않도록 함
+BUNDLE_VERSION = 1
+
+# 유튜브 검색 결과 링크 (각 트랙 별로 parse해서 사용)
+base_url = "https://www.youtube.com/results?"
+
+
+# 트랙 유튜브 검색 링크
+def track_youtube_url(artist_name, track_name):
+    query = {
+        'search_query': '{} {}'.format(artist_name, track_name)
+    }
+    return base_url + parse.urlencode(query, encoding='UTF-8', doseq=True)
+
+
+# 아티스트 유튜브 검색 링크
+def artist_youtube_url(artist_name):
+    return 'https://www.youtube.com/results?search_query={}'.format(artist_name.replace(' ', '+'))
+
+
+# DynamoDB artist_tracks 아이템 -> 인기순 3곡의 ListCard 아이템
+def track_items(artist_name, tracks):
+    tracks = sorted(tracks, key=lambda x: x['popularity'], reverse=True)
+
+    items = []
+
+    for ele in tracks[:3]:
+        track_name = ele['track_name']
+
+        # ListCard 형태에 맞게 리턴
+        temp_dic = {
+            "title": track_name,
+            "description": ele['album_name'],
+            "imageUrl": ele['image_url'],
+            "link": {
+                "web": track_youtube_url(artist_name, track_name)
+            }
+        }
+
+        items.append(temp_dic)
+
+    return items
+
+
+# 카카오톡 응답 관련 함수
+def item_card(title, imageUrl, popularity, followers, externalUrl):
+    return {
+        "itemCard": {
+            "thumbnail": {
+                "imageUrl": imageUrl,
+                "width": 800,
+                "height": 800
+            },
+            "profile": {
+                "title": title,
+                "imageUrl": imageUrl
+
+            },
+            "itemList": [
+                {
+                    "title": "Popularity",
+                    "description": popularity
+                },
+                {
+                    "title": "Followers",
+                    "description": followers
+                }
+            ],
+            "buttons": [
+                {
+                    "label": "Spotify 검색",
+                    "action": "webLink",
+                    "webLinkUrl": externalUrl
+                }
+            ]
+        }
+    }
+
+
+# SimpleText 메시지
+def simple_text(msg):
+    return {
+        "simpleText": {
+            "text": msg
+        }
+    }
+
+
+# ListCard 메시지
+def list_card(title, imageUrl, items, externalUrl):
+    return {
+        "listCard": {
+            "header": {
+                "title": title,
+                "imageUrl": imageUrl
+            },
+            "items": items,
+            "buttons": [
+                {
+                    "label": "다른 노래도 보기",
+                    "action": "webLink",
+                    "webLinkUrl": externalUrl
+                }
+            ]
+        }
+    }
+
+
+# Carousel (여러 장의 카드 메시지)
+# carousel의 type은 필요하면 수정할 수 있도록, 기본값(현재 listCard)을 넣음
+def carousel(items, card_type="listCard"):
+    return {
+        "carousel": {
+            "type": card_type,
+            "items": items
+        }
+    }
+
+
+# 챗봇 메시지
+def message(outputs):
+    return {
+        "version": "2.0",
+        "template": {
+            "outputs": outputs  # 여기에 메시지 카드들이 들어감(list로)
+        }
+    }
+
+
+# DB에 있는 아티스트의 응답 (CASE 2)
+# artist: artists 테이블 row, top_tracks: track_items 결과
+# related: [(관련 아티스트 artists row, 관련 아티스트 track_items 결과), ...] (거리순)
+def artist_message(artist, top_tracks, related):
+    message_queue = []
+
+    # 메세지 작성
+    card_message = list_card(artist['artist_name'], artist['image_url'], top_tracks,
+                             artist_youtube_url(artist['artist_name']))
+
+    item_message = item_card(artist['artist_name'], artist['image_url'], artist['popularity'],
+                             artist['followers'], artist['artist_url'])
+
+    # CASE 2-1: 입력된 아티스트의 관련 아티스트도 DB에 있음
+    if related:
+
+        list_card_message = []
+
+        list_card_message.append(card_message['listCard'])
+
+        for related_artist_data, rel_top_tracks in related:
+            rel_artist_name = related_artist_data['artist_name']
+            rel_image_url = related_artist_data['image_url']
+            rel_youtube_url = artist_youtube_url(rel_artist_name)
+
+            rel_card_message = list_card(rel_artist_name, rel_image_url, rel_top_tracks, rel_youtube_url)['listCard']
+            list_card_message.append(rel_card_message)
+
+        text_message = simple_text("{}와 연관 아티스트 노래를 들어보세요!".format(artist['artist_name']))
+
+        message_queue.append(text_message)
+        message_queue.append(item_message)
+        message_queue.append(carousel(list_card_message))
+
+    # CASE 2-2: 입력된 아티스트의 관련 아티스트는 DB에 없음
+    else:
+        text_message = simple_text("{}의 노래를 들어보세요.".format(artist['artist_name']))
+        message_queue.append(text_message)
+        message_queue.append(item_message)
+        message_queue.append(card_message)
+
+    return message(message_queue)
@@ -0,0 +1,64 @@
+import os
+
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+from related_distance import METRICS, FeatureTable
+
+
+# Athena 대신 parquet 파일을 직접 읽어서 아티스트별 평균, 수치별 최소/최대값 계산
+# source: 's3://bucket' 또는 같은 구조(top-tracks/dt=.../*.parquet, audio-features/dt=.../*.parquet)의 로컬 폴더
+# Athena 쿼리 결과(아티스트별 평균, avgs: {'danceability_min', 'danceability_max', ...})와 같은 값을
+# dict를 거치지 않고 FeatureTable로 리턴 (aggregate_table)
+
+
+# 가장 최근 dt 파티션 폴더 (athena 쿼리의 max(dt)와 같음)
+def latest_partition(filesystem, path):
+    partitions = [info.path for info in filesystem.get_file_info(fs.FileSelector(path))
+                  if info.type == fs.FileType.Directory and info.base_name.startswith('dt=')]
+    if not partitions:
+        raise FileNotFoundError('no dt= partition under {}'.format(path))
+    return max(partitions, key=lambda p: p.rsplit('dt=', 1)[1])
+
+
+def read_latest(filesystem, path, columns):
+    return pq.read_table(latest_partition(filesystem, path), filesystem=filesystem, columns=columns).to_pandas()
+
+
+def read_frames(source):
+    # 로컬 폴더는 상대 경로도 허용
+    if '://' not in source:
+        source = os.path.abspath(source)
+    filesystem, root = fs.FileSystem.from_uri(source)
+    root = root.rstrip('/')
+
+    top_tracks = read_latest(filesystem, root + '/top-tracks', ['artist_id', 'track_id'])
+    audio_features = read_latest(filesystem, root + '/audio-features', ['id'] + METRICS)
+
+    return aggregate_frames(top_tracks, audio_features)
+
+
+# dict를 만들지 않고 바로 FeatureTable
+def aggregate_table(source):
+    return FeatureTable.from_frame(*read_frames(source))
+
+
+# (artist_id index의 아티스트별 평균 DataFrame, avgs)
+def aggregate_frames(top_tracks, audio_features):
+    # 아티스트별 평균 수치 (top_tracks JOIN audio_features GROUP BY artist_id)
+    joined = top_tracks.merge(audio_features, left_on='track_id', right_on='id', how='inner')
+    means = joined.groupby('artist_id', sort=True)[METRICS].mean()
+
+    # 정규화 위해 수치별 최대, 최소값 계산 (acousticness 최소값은 athena 쿼리와 같이 소수점 4자리 반올림)
+    avgs = {}
+    for m in METRICS:
+        avgs[m + '_min'] = float(audio_features[m].min())
+        avgs[m + '_max'] = float(audio_features[m].max())
+    avgs['acousticness_min'] = round(avgs['acousticness_min'], 4)
+
+    return means, avgs
+
+
+# config.ini [RELATED] aggregation = local 일 때 읽을 위치 (기본값: 버킷)
+def local_source(config):
+    return config.get('RELATED', 'local_source', fallback='s3://{}'.format(config['AWS']['bucket_name']))
@@ -0,0 +1,91 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# crawl 결과 parquet 스키마 (Athena 테이블 컬럼과 같은 타입)
+# 스키마를 고정해 두면 배치마다 타입 추론이 달라지지 않고, 배치 하나씩 row group으로 이어 쓸 수 있음
+TOP_TRACKS_SCHEMA = pa.schema([
+    ('track_id', pa.string()),
+    ('artist_id', pa.string()),
+    ('artist_name', pa.string()),
+    ('track_name', pa.string()),
+    ('album_name', pa.string()),
+    ('popularity', pa.int32()),
+    ('image_url', pa.string())
+])
+
+AUDIO_FEATURES_SCHEMA = pa.schema([
+    ('duration_ms', pa.int32()),
+    ('key', pa.int32()),
+    ('mode', pa.int32()),
+    ('time_signature', pa.int32()),
+    ('acousticness', pa.float64()),
+    ('danceability', pa.float64()),
+    ('energy', pa.float64()),
+    ('instrumentalness', pa.float64()),
+    ('liveness', pa.float64()),
+    ('loudness', pa.float64()),
+    ('speechiness', pa.float64()),
+    ('valence', pa.float64()),
+    ('tempo', pa.float64()),
+    ('id', pa.string()),
+    ('type', pa.string()),
+    ('uri', pa.string()),
+    ('track_href', pa.string()),
+    ('analysis_url', pa.string())
+])
+
+
+# 한 번에 쓰는 row 수 (row group 하나)
+WRITE_BATCH = 10000
+
+
+# 스키마 중 일부 컬럼만 (예: pipeline의 top_tracks는 artist_id, track_id만 저장)
+def select_schema(schema, columns):
+    return pa.schema([schema.field(c) for c in columns])
+
+
+# items를 size개씩 list로 묶어서 하나씩 리턴
+def batched(items, size=WRITE_BATCH):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# 배치(dict 목록 또는 DataFrame)를 받을 때마다 row group 하나로 바로 씀
+# 메모리에는 배치 하나만 있고, 전체 데이터를 모아서 한 번에 쓰지 않음
+# where: 파일 경로 또는 파일 객체 (BytesIO 등)
+class ParquetStreamWriter:
+    def __init__(self, where, schema, compression='snappy'):
+        self.schema = schema
+        self.rows = 0
+        self._writer = pq.ParquetWriter(where, schema, compression=compression)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # 스키마에 없는 키는 버리고, 없는 키는 null
+    def write(self, rows):
+        if not rows:
+            return
+        self._write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def write_frame(self, frame):
+        if frame.empty:
+            return
+        frame = frame.reindex(columns=self.schema.names)
+        self._write_table(pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False))
+
+    def _write_table(self, table):
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        self._writer.close()
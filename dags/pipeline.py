@@ -1,20 +1,33 @@
-import base64
+import io
 import json
 import logging
-import math
 import pymysql
 import sys
-import time
 import boto3
-import pandas as pd
+import botocore
 import pendulum
-import requests
+from collections import defaultdict
 from datetime import datetime
 from airflow import DAG
+from airflow.models import Variable
 from airflow.operators.empty import EmptyOperator
 from airflow.operators.python import PythonOperator
 import configparser
 
+from athena_runner import AthenaRunner
+from dynamodb_scan import scan_items
+from feature_store import download_store, upload_store
+from kakao_message import BUNDLE_VERSION, artist_message, track_items
+from local_aggregation import aggregate_table, local_source
+from parquet_stream import AUDIO_FEATURES_SCHEMA, TOP_TRACKS_SCHEMA, ParquetStreamWriter, batched, select_schema
+from related_distance import FeatureTable
+from related_incremental import incremental_related, load_state, save_state
+from related_index import compute_related
+from related_store import store_related
+from s3_upload import S3Uploader
+from task_metrics import TaskMetrics, regressions
+from spotify_api import SpotifyAuth, SpotifyClient
+
 
 # skeleton file
 kst = pendulum.timezone("Asia/Seoul")
@@ -24,7 +37,19 @@ default_args = {
     'start_date': datetime(2023, 1, 1, tzinfo=kst)
 }
 
-athena = boto3.client('athena')
+# incremental 모드에서 사용하는 이전 실행 스냅샷 (S3)
+# query_data가 pending에 올리고, store_data가 MySQL 반영 후 최신 스냅샷으로 복사
+RELATED_STATE_KEY = 'related-artists/state.pickle'
+RELATED_STATE_PENDING_KEY = 'related-artists/state.pending.pickle'
+RELATED_STATE_PATH = '/tmp/related-state.pickle'
+
+# 지난 실행의 task 지표 (metrics_summary에서 비교 후 갱신)
+METRICS_VARIABLE = 'data_to_s3_pipeline_metrics'
+METRICS_TASKS = ['load_top_tracks', 'load_audio_features', 'top_track_athena_table', 'audio_features_athena_table',
+                 'query_data', 'store_data', 'render_bundles']
+
+# 실행 사이에 S3로 유지하는 track_id별 audio feature 저장소
+FEATURE_STORE_PATH = '/tmp/audio-features-store.parquet'
 
 # config.ini 불러오기
 config = configparser.ConfigParser()
@@ -39,157 +64,111 @@ try:
                           port=int(config['DB']['port']),
                           use_unicode=True,
                           charset='utf8')
-    cursor = con.cursor()
 except:
     logging.error("mysql connection error")
     sys.exit(1)
 
+# Athena 쿼리 실행 (backoff polling, 실패/취소/시간 초과 처리, 여러 쿼리 동시 실행)
+athena = boto3.client('athena')
+runner = AthenaRunner(athena, 'related_artists', 's3://{}/related_artists'.format(config['AWS']['bucket_name']),
+                      poll_max=config.getfloat('ATHENA', 'poll_max', fallback=5),
+                      timeout=config.getfloat('ATHENA', 'timeout', fallback=900),
+                      read_csv=config.getboolean('ATHENA', 'read_csv', fallback=False))
 
+# API 헤더에 들어가는 Token: 만료 전까지 재사용
+# Spotify API 호출은 연결을 재사용하고 429/401/5xx를 재시도
+spotify = SpotifyClient(SpotifyAuth(config['API']['client_id'], config['API']['client_secret']))
 
-def get_token():
-    client_id = config['API']['client_id']
-    client_secret = config['API']['client_secret']  
-    endpoint = "https://accounts.spotify.com/api/token"
-
-    encoded = base64.b64encode("{}:{}".format(client_id, client_secret).encode('utf-8')).decode('ascii')
-
-    headers = {"Authorization": "Basic {}".format(encoded)}
-    payload = {"grant_type": "client_credentials"}
-
-    response = requests.post(endpoint, data=payload, headers=headers)
-    access_token = json.loads(response.text)['access_token']
-
-    headers = {"Authorization": "Bearer {}".format(access_token)}
-
-    return headers
-
-
-def get_query_result(query_id):
-    response = athena.get_query_execution(
-        QueryExecutionId=str(query_id)
-    )
-
-    # 쿼리가 완료될 때까지 충분한 시간 대기
-    while response['QueryExecution']['Status']['State'] != 'SUCCEEDED':
-        if response['QueryExecution']['Status']['State'] == 'FAILED':
-            logging.error('QUERY FAILED')
-            break
-        time.sleep(5)  # 데이터의 양을 보면, Athena에서 처리 시간을 통해 어느 정도 걸리는지 알 수 있음 -> 5초
-        response = athena.get_query_execution(
-            QueryExecutionId=str(query_id)
-        )
-
-    response = athena.get_query_results(
-        QueryExecutionId=str(query_id),
-        MaxResults=1000  # Athena는 MaxResults가 1000
-    )
-
-    return response
-
-
-# 쿼리 결과 데이터 전처리
-def process_data(results):
-    data = results['ResultSet']
-    columns = [col['VarCharValue'] for col in data['Rows'][0]['Data']]
-    # columns = [col['Label'] for col in results['ResultSet']['ResultSetMetadata']['ColumnInfo']]
+# crawl 결과 parquet을 메모리에서 바로 S3에 올림 (checksum 검증, 큰 파일은 multipart)
+uploader = S3Uploader()
 
-    listed_results = []
-    for row in data['Rows'][1:]:  # 행별로 저장
-        values = []
-        for col in row['Data']:
-            try:
-                values.append(col['VarCharValue'])  # 각 칼럼의 값들이 {'VarCharValue': value} 형식
-            except:  # null일 경우?
-                values.append('')
-        listed_results.append(dict(zip(columns, values)))
 
-    return listed_results
+# 이번 실행의 파티션 key (두 로딩 task가 같은 날짜를 쓰도록 실행 시각 기준)
+def partition_key(prefix, filename, context):
+    dt = context['data_interval_end'].in_timezone('UTC').strftime("%Y-%m-%d")
+    return '{}/dt={}/{}'.format(prefix, dt, filename)
 
 
-def normalize(x, x_min, x_max):
-    normalized = (x - x_min) / (x_max - x_min)
-    return normalized
+# artist_tracks 테이블 parallel scan segment 수 (1이면 순서대로 한 페이지씩)
+scan_segments = config.getint('DYNAMODB', 'scan_segments', fallback=4)
 
 
-def insert_row(data, table):
-    placeholders = ', '.join(['%s'] * len(data))
-    columns = ', '.join(data.keys())
+# S3에 저장된 이전 실행 스냅샷 불러오기 (없으면 None)
+def download_related_state():
+    s3 = boto3.client('s3')
+    try:
+        s3.download_file(config['AWS']['bucket_name'], RELATED_STATE_KEY, RELATED_STATE_PATH)
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            return None
+        raise
+    return load_state(RELATED_STATE_PATH)
 
-    key_placeholders = ', '.join(['{0}=%s'.format(k) for k in data.keys()])
-    # 기본적으로 insert 하되, 키가 같으면 update
-    sql = "INSERT INTO %s ( %s ) VALUES ( %s ) ON DUPLICATE KEY UPDATE %s" % (
-        table, columns, placeholders, key_placeholders)
-    cursor.execute(sql, list(data.values()) * 2)  # *2: values()와 on duplicate key update에 값이 중복되어 들어가기 때문에, 2번 사용
 
 # top_tracks 데이터 로딩
-def load_top_tracks():
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table('artist_tracks')
-    response = table.scan(
-        ProjectionExpression='artist_id, track_id',
-    )
-    top_tracks = response['Items']
-    top_tracks = pd.DataFrame(top_tracks)
-    top_tracks.to_parquet('/tmp/top-tracks.parquet', engine="pyarrow", compression="snappy")
+# scan 결과를 모두 모으지 않고 배치마다 row group으로 바로 씀
+# 로컬 파일 없이 메모리에 쓰고 바로 S3에 올림
+def load_top_tracks(**context):
+    metrics = TaskMetrics('load_top_tracks')
+    schema = select_schema(TOP_TRACKS_SCHEMA, ['artist_id', 'track_id'])
+    buffer = io.BytesIO()
+    with metrics.phase('scan'), ParquetStreamWriter(buffer, schema) as writer:
+        for batch in batched(scan_items('artist_tracks', segments=scan_segments, projection='artist_id, track_id')):
+            writer.write(batch)
 
+    data = buffer.getvalue()
+    with metrics.phase('upload'):
+        uploader.upload(config['AWS']['bucket_name'], partition_key('top-tracks', 'top_tracks.parquet', context), data)
 
-# audio_feature 데이터 로딩
-def load_audio_features():
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table('artist_tracks')
-    response = table.scan()
-    track_data = response['Items']
-    track_ids = [track['track_id'] for track in track_data]
-
-    audio_features = []
-    list_track_id_binds = [track_ids[i:i + 100] for i in range(0, len(track_ids), 100)]
-
-    for track_id_bind in list_track_id_binds:
-        ids = ','.join(track_id_bind)
-        endpoint = "https://api.spotify.com/v1/audio-features/?ids={}".format(ids)
-        headers = get_token()
-        response = requests.get(endpoint, headers=headers)
-        data = json.loads(response.text)
-
-        audio_features.extend(data['audio_features'])
-        audio_features = pd.DataFrame(audio_features)
-        audio_features.to_parquet('/tmp/audio-features.parquet', engine="pyarrow", compression="snappy")
-
-
-
-def upload_to_s3():
-    s3 = boto3.resource('s3')
-    date_time = datetime.utcnow().strftime("%Y-%m-%d")  
-    bucket = s3.Object(config['AWS']['bucket_name'], 'top-tracks/dt={}/top_tracks.parquet'.format(time))
-    data = open('/tmp/top-tracks.parquet', 'rb')
-    bucket.put(Body=data)
-
-    s3 = boto3.resource('s3')
-    date_time = datetime.utcnow().strftime("%Y-%m-%d")
-    bucket = s3.Object(config['AWS']['bucket_name'], 'audio-features/dt={}/audio_features.parquet'.format(time))
-    data = open('/tmp/audio-features.parquet', 'rb')
-    bucket.put(Body=data)
-
-
-def query_athena(query):
-    response = athena.start_query_execution(
-        QueryString=query,
-        QueryExecutionContext={
-            'Database': 'related_artists'
-        },
-        ResultConfiguration={
-            # 쿼리 결과 저장하는 위치 지정
-            'OutputLocation': 's3://{}/related_artists'.format(config['AWS']['bucket_name']),
-            'EncryptionConfiguration': {
-                'EncryptionOption': 'SSE_S3'
-            }
-        }
-    )
+    metrics.set('rows', writer.rows)
+    metrics.set('bytes', len(data))
+    metrics.publish(context)
 
-    return response
 
-
-def create_top_track_athena_table():
+# audio_feature 데이터 로딩
+# 저장소에 없는 트랙만 API 호출 (같은 트랙은 한 번만), 나머지는 저장소에서 가져옴
+def load_audio_features(**context):
+    metrics = TaskMetrics('load_audio_features')
+    requests, retries, token_requests = spotify.requests, spotify.retries, spotify.auth.token_requests
+
+    with metrics.phase('scan'):
+        track_ids = [track['track_id'] for track in
+                     scan_items('artist_tracks', segments=scan_segments, projection='track_id')]
+
+    with metrics.phase('store_download'):
+        store = download_store(config['AWS']['bucket_name'], FEATURE_STORE_PATH)
+    missing = store.missing(track_ids)
+    list_track_id_binds = [missing[i:i + 100] for i in range(0, len(missing), 100)]
+
+    with metrics.phase('fetch'):
+        for track_id_bind in list_track_id_binds:
+            ids = ','.join(track_id_bind)
+            data = spotify.get('audio-features', params={'ids': ids})
+            store.add(data['audio_features'])
+
+    buffer = io.BytesIO()
+    with metrics.phase('write'), ParquetStreamWriter(buffer, AUDIO_FEATURES_SCHEMA) as writer:
+        for batch in batched(dict.fromkeys(track_ids)):
+            writer.write_frame(store.select(batch))
+
+    data = buffer.getvalue()
+    with metrics.phase('upload'):
+        uploader.upload(config['AWS']['bucket_name'],
+                        partition_key('audio-features', 'audio_features.parquet', context), data)
+        upload_store(store, config['AWS']['bucket_name'], FEATURE_STORE_PATH)
+
+    metrics.set('tracks', writer.rows)
+    metrics.set('fetched', store.added)
+    metrics.set('store_size', len(store))
+    metrics.set('bytes', len(data))
+    metrics.set('api_calls', spotify.requests - requests)
+    metrics.set('retries', spotify.retries - retries)
+    metrics.set('token_requests', spotify.auth.token_requests - token_requests)
+    metrics.publish(context)
+
+
+def create_top_track_athena_table(**context):
+    metrics = TaskMetrics('top_track_athena_table')
     query = """
         create external table if not exists top_tracks(
         artist_id string,
@@ -197,16 +176,15 @@ def create_top_track_athena_table():
         ) partitioned by (dt string)
         stored as parquet location 's3://{}/top-tracks' tblproperties("parquet.compress" = "snappy")
     """.format(config['AWS']['bucket_name'])
-    r = query_athena(query)
+    query_ids = [runner.run(query), runner.run('msck repair table top_tracks')]
+    print('top_tracks partition update!')
 
-    if r['ResponseMetadata']['HTTPStatusCode'] == 200:
-        query = 'msck repair table top_tracks'
-        r = query_athena(query)
-        if r['ResponseMetadata']['HTTPStatusCode'] == 200:
-            print('top_tracks partition update!')
+    metrics.update(runner.statistics(query_ids), prefix='athena.')
+    metrics.publish(context)
 
 
-def create_audio_features_athena_table():
+def create_audio_features_athena_table(**context):
+    metrics = TaskMetrics('audio_features_athena_table')
     query = """
         create external table if not exists audio_features(
         duration_ms int,
@@ -226,17 +204,16 @@ def create_audio_features_athena_table():
         ) partitioned by (dt string)
         stored as parquet location 's3://{}/audio-features' tblproperties("parquet.compress" = "snappy")
     """.format(config['AWS']['bucket_name'])
-    r = query_athena(query)
+    query_ids = [runner.run(query), runner.run('msck repair table audio_features')]
+    print('audio_features partition update!')
 
-    if r['ResponseMetadata']['HTTPStatusCode'] == 200:
-        query = 'msck repair table audio_features'
-        r = query_athena(query)
-        if r['ResponseMetadata']['HTTPStatusCode'] == 200:
-            print('audio_features partition update!')
+    metrics.update(runner.statistics(query_ids), prefix='athena.')
+    metrics.publish(context)
 
 
-def query_data():
-    query = """
+def query_data(**context):
+    metrics = TaskMetrics('query_data')
+    artists_query = """
            SELECT
                artist_id,
                avg(danceability) as danceability,
@@ -256,12 +233,8 @@ def query_data():
                t1.artist_id
        """
 
-    r = query_athena(query)
-    results = get_query_result(r['QueryExecutionId'])
-    artists = process_data(results)
-
     # # 정규화 위해 수치별 최대, 최소값 계산. 가장 최근 날짜 데이터 사용
-    query = """
+    avgs_query = """
            SELECT
                MIN(danceability) AS danceability_min,
                MAX(danceability) AS danceability_max,
@@ -281,53 +254,137 @@ def query_data():
                dt = (select max(dt) from audio_features)
        """
 
-    r = query_athena(query)
-    results = get_query_result(r['QueryExecutionId'])
-    avgs = process_data(results)[0]
-
-    metrics = ['danceability', 'energy', 'loudness', 'speechiness', 'acousticness', 'instrumentalness']
-
-    related_data = []
-
-    for i in range(len(artists)):
-        data = []  # 일단 다 넣고, 정렬해서 최소 거리인 5개를 sql에 넣기
-
-        others = artists.copy()  # temp: 자기 자신 뺀 것.
-        mine = others.pop(i)  # mine: 자기 자신.
-        for other in others:
-            dist = 0
-            for m in metrics:
-                # mine과 other 간 거리 계산
-                x = float(mine[m])
-                x_norm = normalize(x, float(avgs[m + '_min']), float(avgs[m + '_max']))
-                y = float(other[m])
-                y_norm = normalize(y, float(avgs[m + '_min']), float(avgs[m + '_max']))
-                dist += math.sqrt((x_norm - y_norm) ** 2)
-
-            if dist != 0:
-                temp = {
-                    'artist_id': mine['artist_id'],
-                    'related_artist_id': other['artist_id'],
-                    'distance': dist
-                }
-                data.append(temp)
-
-        # 아티스트별로 가까운 5개만 MySQL에 삽입
-        # 날짜는 삽입 시점의 timestamp로 넣도록 테이블에서 설정해 놓았으므로, 신경 쓰지 않아도 됨
-        data = sorted(data, key=lambda x: x['distance'])[:5]
-
-        related_data.append(data)
-
+    # aggregation = local 이면 Athena 대신 parquet 파일을 직접 읽어서 같은 결과 계산
+    # (기본값은 config.ini [RELATED] aggregation, DAG 실행 conf의 aggregation으로 실행마다 바꿀 수 있음)
+    dag_run = context.get('dag_run')
+    method = (dag_run.conf or {}).get('aggregation') if dag_run else None
+    method = method or config.get('RELATED', 'aggregation', fallback='athena')
+    with metrics.phase('aggregate'):
+        if method == 'local':
+            table = aggregate_table(local_source(config))
+        else:
+            # 두 집계 쿼리를 동시에 실행
+            query_ids = runner.run_all([artists_query, avgs_query])
+            artists_id, avgs_id = query_ids
+            # 결과는 NextToken을 따라 모든 페이지를 읽고, 컬럼 타입(double 등)대로 변환
+            # 아티스트 id 목록 + float 행렬 + 정규화 범위로 한 번만 변환 (dict 목록은 만들지 않음)
+            avgs = next(runner.rows(avgs_id))
+            table = FeatureTable.from_rows(runner.rows(artists_id), avgs)
+            metrics.update(runner.statistics(query_ids), prefix='athena.')
+    metrics.set('aggregation', method)
+    metrics.set('artists', len(table))
+
+    # 정규화된 feature 행렬을 한 번만 만들고,
+    # config.ini [RELATED] method에 따라 전체 거리 계산 또는 KD-tree 인덱스 검색
+    # 아티스트별로 가까운 5개만 남김 (MySQL 삽입은 store_data에서)
+    ids, features = table.ids, table.features
+
+    # incremental = true 이면 이전 실행 이후 바뀐 아티스트와 그 영향을 받는 아티스트만 다시 계산하고,
+    # 목록이 바뀐 아티스트만 리턴
+    incremental = config.getboolean('RELATED', 'incremental', fallback=False)
+    with metrics.phase('compute'):
+        if incremental:
+            previous = download_related_state()
+            related_data, state = incremental_related(ids, features, table.bounds, previous, config, k=5)
+            save_state(state, RELATED_STATE_PATH)
+            boto3.client('s3').upload_file(RELATED_STATE_PATH, config['AWS']['bucket_name'],
+                                           RELATED_STATE_PENDING_KEY)
+        else:
+            related_data = compute_related(ids, features, config, k=5)
+
+    metrics.set('incremental', incremental)
+    metrics.set('related_lists', len(related_data))
+    metrics.publish(context)
     return related_data
 
 
 def store_data(**context):
     related_data = context['task_instance'].xcom_pull(task_ids='query_data')
-    for data in related_data:
-        for row in data:
-            insert_row(row, 'related_artists')
-    conn.commit()
-    cursor.close()
+
+    # chunk 단위 multi-row upsert + chunk별 commit
+    # swap = true 이면 전체 결과를 shadow 테이블에 쓰고 RENAME TABLE로 한 번에 교체
+    metrics = TaskMetrics('store_data')
+    incremental = config.getboolean('RELATED', 'incremental', fallback=False)
+    with metrics.phase('write'):
+        written = store_related(conn, related_data, config, full=not incremental)
+    metrics.set('incremental', incremental)
+    metrics.set('related_lists', len(related_data))
+    metrics.set('rows_written', written)
+
+    # MySQL 반영이 끝난 스냅샷을 다음 실행의 기준으로 사용
+    if incremental:
+        bucket = config['AWS']['bucket_name']
+        boto3.client('s3').copy_object(Bucket=bucket, Key=RELATED_STATE_KEY,
+                                       CopySource={'Bucket': bucket, 'Key': RELATED_STATE_PENDING_KEY})
+
+    metrics.publish(context)
+
+
+# 아티스트별 챗봇 응답(CASE 2)을 미리 만들어 DynamoDB artist_bundles 테이블에 저장
+# 챗봇 Lambda는 번들이 있으면 조회 한 번으로 응답하고, 없거나 오래됐으면 실시간으로 만듦
+def render_bundles(**context):
+    metrics = TaskMetrics('render_bundles')
+    dt = context['ds']
+
+    with metrics.phase('mysql'):
+        cursor = conn.cursor()
+
+        cursor.execute("select * from artists")
+        cols = [ele[0] for ele in cursor.description]
+        artists = {artist['artist_id']: artist for artist in (dict(zip(cols, row)) for row in cursor.fetchall())}
+
+        # 챗봇과 같이 거리순 3명 (artists 테이블에 있는 아티스트만)
+        cursor.execute("select artist_id, related_artist_id from related_artists order by artist_id, distance")
+        related = defaultdict(list)
+        for artist_id, related_artist_id in cursor.fetchall():
+            if related_artist_id in artists and len(related[artist_id]) < 3:
+                related[artist_id].append(related_artist_id)
+        cursor.close()
+
+    with metrics.phase('scan'):
+        tracks = defaultdict(list)
+        for item in scan_items('artist_tracks', segments=scan_segments):
+            tracks[item['artist_id']].append(item)
+
+    table = boto3.resource('dynamodb').Table('artist_bundles')
+    with metrics.phase('write'), table.batch_writer(overwrite_by_pkeys=['artist_id']) as batch:
+        for artist_id, artist in artists.items():
+            top_tracks = track_items(artist['artist_name'], tracks[artist_id])
+            rel = [(artists[r], track_items(artists[r]['artist_name'], tracks[r])) for r in related[artist_id]]
+            body = json.dumps(artist_message(artist, top_tracks, rel))
+            batch.put_item(Item={
+                'artist_id': artist_id,
+                'dt': dt,
+                'version': BUNDLE_VERSION,
+                'body': body
+            })
+            metrics.add('bytes', len(body))
+
+    print('{} artist bundles rendered'.format(len(artists)))
+    metrics.set('bundles', len(artists))
+    metrics.publish(context)
+
+
+# 각 task가 XCom(key='metrics')에 올린 지표를 모아 로그로 남기고, 지난 실행과 비교해서 나빠진 값을 표시
+# 지난 실행 지표는 Airflow Variable에 저장
+def metrics_summary(**context):
+    current = {}
+    for task_id in METRICS_TASKS:
+        record = context['ti'].xcom_pull(task_ids=task_id, key='metrics')
+        if record:
+            current[task_id] = record
+
+    previous = Variable.get(METRICS_VARIABLE, default_var={}, deserialize_json=True)
+    found = regressions(current, previous,
+                        ratio=config.getfloat('METRICS', 'regression_ratio', fallback=0.5))
+
+    logging.info('pipeline metrics {}'.format(json.dumps(current, sort_keys=True)))
+    for r in found:
+        logging.warning('regression {task} {metric}: {previous} -> {current}'.format(**r))
+
+    Variable.set(METRICS_VARIABLE, {'run_id': context['run_id'], **current}, serialize_json=True)
+    context['ti'].xcom_push(key='regressions', value=found)
+    return found
 
 
 with DAG(dag_id='data_to_s3_pipeline',
@@ -350,11 +407,6 @@ with DAG(dag_id='data_to_s3_pipeline',
         python_callable=load_top_tracks
     )
 
-    upload_to_s3 = PythonOperator(
-        task_id='upload_to_s3',
-        python_callable=upload_to_s3
-    )
-
     top_track_athena_table = PythonOperator(
         task_id='top_track_athena_table',
         python_callable=create_top_track_athena_table
@@ -375,12 +427,24 @@ with DAG(dag_id='data_to_s3_pipeline',
         python_callable=store_data
     )
 
+    render_bundles = PythonOperator(
+        task_id='render_bundles',
+        python_callable=render_bundles
+    )
+
+    metrics_summary = PythonOperator(
+        task_id='metrics_summary',
+        python_callable=metrics_summary
+    )
+
     end_pipeline = EmptyOperator(
         task_id='end_pipeline'
     )
 
 start_pipeline >> [load_audio_features, load_top_tracks]
 
-[load_audio_features, load_top_tracks] >> upload_to_s3 >> [top_track_athena_table, audio_features_athena_table]
+# 두 로딩 task가 각각 S3에 바로 올림 (동시에 실행), 테이블 task는 자기 파티션을 올린 로딩 task만 기다림
+load_top_tracks >> top_track_athena_table
+load_audio_features >> audio_features_athena_table
 
-[top_track_athena_table, audio_features_athena_table] >> query_data >> store_data >> end_pipeline
+[top_track_athena_table, audio_features_athena_table] >> query_data >> store_data >> render_bundles >> metrics_summary >> end_pipeline
@@ -0,0 +1,158 @@
+import numpy as np
+
+# 거리 계산에 사용하는 audio feature 수치
+METRICS = ['danceability', 'energy', 'loudness', 'speechiness', 'acousticness', 'instrumentalness']
+
+# 한 블록(행 묶음)의 거리 행렬이 차지할 최대 메모리 (byte)
+BLOCK_BYTES = 64 * 1024 * 1024
+
+
+# 정규화 계산 함수 (numpy 배열 단위)
+def normalize(x, x_min, x_max):
+    normalized = (x - x_min) / (x_max - x_min)
+    return normalized
+
+
+# 수치별 최소/최대값 (정규화 범위)
+def feature_bounds(avgs, metrics=METRICS):
+    x_min = np.array([float(avgs[m + '_min']) for m in metrics], dtype=np.float64)
+    x_max = np.array([float(avgs[m + '_max']) for m in metrics], dtype=np.float64)
+    return x_min, x_max
+
+
+# 아티스트 feature 테이블
+# - ids: 아티스트 id 목록 (행 순서)
+# - values: 아티스트별 평균 수치 (n x 수치 개수, 연속된 float64 행렬)
+# - x_min, x_max: 수치별 정규화 범위
+# - features: 정규화된 행렬 (처음 사용할 때 한 번만 계산)
+# 쿼리 결과에서 한 번만 만들고, 거리 계산 / incremental 스냅샷 / 인덱스가 모두 이 배열을 그대로 사용
+class FeatureTable:
+    def __init__(self, ids, values, x_min, x_max, metrics=METRICS):
+        self.ids = list(ids)
+        self.metrics = list(metrics)
+        self.values = np.ascontiguousarray(values, dtype=np.float64).reshape(len(self.ids), len(self.metrics))
+        self.x_min = np.asarray(x_min, dtype=np.float64)
+        self.x_max = np.asarray(x_max, dtype=np.float64)
+        self._features = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def bounds(self):
+        return self.x_min, self.x_max
+
+    @property
+    def features(self):
+        if self._features is None:
+            self._features = normalize(self.values, self.x_min, self.x_max)
+        return self._features
+
+    # 쿼리 결과(아티스트별 평균 dict, 수치별 최소/최대 dict)에서 생성
+    # artists는 한 번만 순회하므로 결과 페이지를 읽는 generator를 그대로 넘겨도 됨 (dict 목록을 모아 두지 않음)
+    # 문자열 값이면 여기서 한 번만 float 변환
+    @classmethod
+    def from_rows(cls, artists, avgs, metrics=METRICS):
+        ids = []
+
+        def values():
+            for artist in artists:
+                ids.append(artist['artist_id'])
+                for m in metrics:
+                    yield float(artist[m])
+
+        values = np.fromiter(values(), dtype=np.float64)
+        return cls(ids, values, *feature_bounds(avgs, metrics), metrics=metrics)
+
+    # artist_id를 index로 하고 수치별 컬럼이 있는 DataFrame에서 생성 (dict를 거치지 않음)
+    @classmethod
+    def from_frame(cls, frame, avgs, metrics=METRICS):
+        return cls(frame.index.tolist(), frame[metrics].to_numpy(dtype=np.float64), *feature_bounds(avgs, metrics),
+                   metrics=metrics)
+
+
+# block 행들과 전체 아티스트 사이의 거리 (수치별 |x - y|의 합)
+# 기존 루프와 같은 순서로 수치를 더해 결과가 비트 단위로 같도록 함
+# columns: 수치별로 연속된 메모리에 둔 features.T (없으면 여기서 만듦)
+def pairwise_distances(block, features, columns=None):
+    if columns is None:
+        columns = np.ascontiguousarray(features.T)
+    dist = np.zeros((len(block), len(features)), dtype=np.float64)
+    diff = np.empty_like(dist)
+    for j in range(features.shape[1]):
+        np.subtract(block[:, j, None], columns[j], out=diff)
+        np.abs(diff, out=diff)
+        dist += diff
+
+    # 거리가 0인 경우(자기 자신, 수치가 완전히 같은 아티스트)는 기존과 같이 제외
+    dist[dist == 0] = np.inf
+    return dist
+
+
+# features[start:stop] 행과 전체 아티스트 사이의 거리
+def block_distances(features, start, stop, columns=None):
+    return pairwise_distances(features[start:stop], features, columns)
+
+
+# 행별로 거리가 가장 가까운 k개의 (인덱스, 거리)를 거리 -> 인덱스 순으로 정렬해 리턴
+# 전체 정렬 대신 argpartition으로 k개만 고름
+def top_k(dist, k):
+    k = min(k, dist.shape[1])
+    if k == 0:
+        return np.empty((len(dist), 0), dtype=np.intp), np.empty((len(dist), 0), dtype=np.float64)
+
+    idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(dist, idx, axis=1)
+    order = np.lexsort((idx, part), axis=1)
+    idx = np.take_along_axis(idx, order, axis=1)
+    part = np.take_along_axis(part, order, axis=1)
+
+    # k번째 거리와 같은 값이 여럿이면 argpartition은 임의로 고르므로,
+    # 해당 행만 기존 구현(안정 정렬)처럼 앞쪽 인덱스를 우선해서 다시 고름
+    kth = part[:, -1]
+    ties = np.isfinite(kth) & ((dist <= kth[:, None]).sum(axis=1) > k)
+    for r in np.flatnonzero(ties):
+        candidates = np.flatnonzero(dist[r] <= kth[r])
+        candidates = candidates[np.lexsort((candidates, dist[r, candidates]))][:k]
+        idx[r] = candidates
+        part[r] = dist[r, candidates]
+
+    return idx, part
+
+
+# 한 번에 계산할 행 개수: 블록 거리 행렬이 BLOCK_BYTES를 넘지 않도록
+def block_rows(n, block_bytes=BLOCK_BYTES):
+    return max(1, block_bytes // (max(n, 1) * 8))
+
+
+# (인덱스, 거리) 한 행을 MySQL related_artists 테이블 row 형식으로 변환
+def related_rows(ids, i, idx, dist):
+    data = []
+    for j, d in zip(idx, dist):
+        if not np.isfinite(d):
+            break
+        data.append({
+            'artist_id': ids[i],
+            'related_artist_id': ids[j],
+            'distance': float(d)
+        })
+    return data
+
+
+# 아티스트별로 가까운 k개의 관련 아티스트 계산
+# 리턴 형식은 기존과 같음: 아티스트별 [{'artist_id', 'related_artist_id', 'distance'}, ...]
+def nearest_artists(ids, features, k=5, block_bytes=BLOCK_BYTES):
+    features = np.asarray(features, dtype=np.float64)
+    n = len(ids)
+    rows = block_rows(n, block_bytes)
+    columns = np.ascontiguousarray(features.T)
+
+    related_data = []
+    for start in range(0, n, rows):
+        stop = min(start + rows, n)
+        idx, dist = top_k(block_distances(features, start, stop, columns), k)
+
+        for r in range(stop - start):
+            related_data.append(related_rows(ids, start + r, idx[r], dist[r]))
+
+    return related_data
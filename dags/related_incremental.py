@@ -0,0 +1,176 @@
+import logging
+import os
+import pickle
+
+import numpy as np
+
+from related_distance import BLOCK_BYTES, block_rows, pairwise_distances, top_k
+from related_index import compute_related
+from related_store import cleared_rows
+
+# 변경된 아티스트가 이 비율보다 많으면 전체 재계산이 더 빠름
+FULL_RECOMPUTE_RATIO = 0.5
+
+
+# 이전 실행 결과 스냅샷
+# - features: 거리 계산에 사용한 정규화된 feature 행렬, bounds: 정규화에 사용한 (최소, 최대)
+# - related: 아티스트별 [(related_artist_id, distance), ...]
+def make_state(ids, features, bounds, related, k):
+    return {
+        'k': k,
+        'ids': list(ids),
+        'features': np.asarray(features, dtype=np.float64),
+        'bounds': (np.asarray(bounds[0], dtype=np.float64), np.asarray(bounds[1], dtype=np.float64)),
+        'related': related
+    }
+
+
+def save_state(state, path):
+    with open(path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+# 스냅샷이 없으면(첫 실행) None
+def load_state(path):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+# [(related_artist_id, distance), ...] -> MySQL related_artists row 형식
+# 목록이 비었으면 기존 row를 지우도록 cleared_rows
+def to_rows(artist_id, related):
+    if not related:
+        return cleared_rows(artist_id)
+    return [{'artist_id': artist_id, 'related_artist_id': r, 'distance': d} for r, d in related]
+
+
+# 전체 재계산 결과(아티스트 순서대로의 row 목록)로 스냅샷 생성
+def full_state(ids, features, bounds, related_data, k):
+    related = {}
+    for artist_id, data in zip(ids, related_data):
+        related[artist_id] = [(d['related_artist_id'], d['distance']) for d in data]
+    return make_state(ids, features, bounds, related, k)
+
+
+# 두 후보 목록 (인덱스, 거리)을 합쳐 거리 -> 인덱스 순으로 k개만 남김
+def merge_top_k(idx_a, dist_a, idx_b, dist_b, k):
+    idx = np.hstack([idx_a, idx_b])
+    dist = np.hstack([dist_a, dist_b])
+    order = np.lexsort((idx, dist), axis=1)[:, :k]
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(dist, order, axis=1)
+
+
+# 새로 추가되었거나 feature 벡터가 tolerance 이상 바뀐 아티스트만 다시 계산
+# - 바뀐 아티스트: 전체 아티스트와의 거리로 목록 재계산
+# - 기존 아티스트: 목록에 바뀐/삭제된 아티스트가 있으면 재계산,
+#   바뀐 아티스트가 기존 k번째보다 가까우면 기존 목록과 합쳐서 갱신
+# 정규화 범위(최소/최대)가 바뀌면 모든 거리가 바뀌므로 전체 재계산
+# 리턴: (목록이 바뀐 아티스트들의 row 목록, 새 스냅샷)
+def incremental_related(ids, features, bounds, previous, config, k=5, block_bytes=BLOCK_BYTES):
+    tol = config.getfloat('RELATED', 'tolerance', fallback=1e-6)
+    features = np.array(features, dtype=np.float64)
+    n = len(ids)
+
+    # 목록이 빈 아티스트도 기존 row가 지워지도록 cleared_rows로 바꿈
+    def full():
+        related_data = compute_related(ids, features, config, k=k)
+        state = full_state(ids, features, bounds, related_data, k)
+        return [data or cleared_rows(artist_id) for artist_id, data in zip(ids, related_data)], state
+
+    if previous is None or previous['k'] != k:
+        logging.info('related: no previous state, full recompute')
+        return full()
+
+    if (np.abs(bounds[0] - previous['bounds'][0]).max() > tol
+            or np.abs(bounds[1] - previous['bounds'][1]).max() > tol):
+        logging.info('related: normalization bounds changed, full recompute')
+        return full()
+
+    # 이전 스냅샷과 feature 벡터 비교
+    prev_pos = {a: i for i, a in enumerate(previous['ids'])}
+    pos = np.array([prev_pos.get(a, -1) for a in ids], dtype=np.intp)
+    known = pos >= 0
+    drift = np.full(n, np.inf)
+    drift[known] = np.abs(features[known] - previous['features'][pos[known]]).max(axis=1)
+    changed = drift > tol
+
+    # 허용 범위 안에서만 바뀐 아티스트는 이전 벡터를 그대로 사용 (저장된 거리와 일관성 유지)
+    unchanged = np.flatnonzero(~changed)
+    features[unchanged] = previous['features'][pos[unchanged]]
+
+    if changed.sum() > n * FULL_RECOMPUTE_RATIO:
+        logging.info('related: {} of {} artists changed, full recompute'.format(changed.sum(), n))
+        return full()
+
+    index_of = {a: i for i, a in enumerate(ids)}
+    stale = set(ids[i] for i in np.flatnonzero(changed)) | (set(previous['ids']) - set(ids))
+    old = previous['related']
+
+    # 기존 목록에 바뀐/삭제된 아티스트가 들어 있으면 재계산 대상
+    recompute = np.zeros(n, dtype=bool)
+    old_kth = np.full(n, np.inf)
+    for j in unchanged:
+        related = old[ids[j]]
+        if any(r in stale for r, _ in related):
+            recompute[j] = True
+        elif len(related) >= k:
+            old_kth[j] = related[k - 1][1]
+
+    columns = np.ascontiguousarray(features.T)
+    rows = block_rows(n, block_bytes)
+    new_lists = {}
+
+    # 바뀐 아티스트: 전체와의 거리 계산
+    # 거리는 대칭이므로 같은 블록에서 기존 아티스트별로 가장 가까운 바뀐 아티스트 k개도 모아 둠
+    changed_idx = np.flatnonzero(changed)
+    cand_idx = np.full((n, 0), -1, dtype=np.intp)
+    cand_dist = np.full((n, 0), np.inf)
+    for start in range(0, len(changed_idx), rows):
+        block = changed_idx[start:start + rows]
+        dist = pairwise_distances(features[block], features, columns)
+
+        idx, d = top_k(dist, k)
+        for r, i in enumerate(block):
+            new_lists[i] = (idx[r], d[r])
+
+        col_idx, col_dist = top_k(dist.T, k)
+        cand_idx, cand_dist = merge_top_k(cand_idx, cand_dist, block[col_idx], col_dist, k)
+
+    # 목록에 바뀐/삭제된 아티스트가 있던 기존 아티스트: 전체 재계산
+    recompute_idx = np.flatnonzero(recompute)
+    for start in range(0, len(recompute_idx), rows):
+        block = recompute_idx[start:start + rows]
+        idx, d = top_k(pairwise_distances(features[block], features, columns), k)
+        for r, i in enumerate(block):
+            new_lists[i] = (idx[r], d[r])
+
+    # 바뀐 아티스트가 기존 k번째 이웃보다 가까워진 아티스트: 기존 목록과 합침
+    if cand_dist.shape[1]:
+        affected = ~changed & ~recompute & (cand_dist[:, 0] <= old_kth)
+        for j in np.flatnonzero(affected):
+            related = old[ids[j]]
+            old_idx = np.array([[index_of[r] for r, _ in related]], dtype=np.intp).reshape(1, -1)
+            old_dist = np.array([[d for _, d in related]], dtype=np.float64).reshape(1, -1)
+            idx, d = merge_top_k(old_idx, old_dist, cand_idx[j:j + 1], cand_dist[j:j + 1], k)
+            new_lists[j] = (idx[0], d[0])
+
+    # 이전과 목록이 달라진 아티스트만 리턴
+    related = {}
+    related_data = []
+    for i, artist_id in enumerate(ids):
+        if i not in new_lists:
+            related[artist_id] = old[artist_id]
+            continue
+
+        idx, d = new_lists[i]
+        current = [(ids[j], float(x)) for j, x in zip(idx, d) if np.isfinite(x)]
+        related[artist_id] = current
+        if current != old.get(artist_id):
+            related_data.append(to_rows(artist_id, current))
+
+    logging.info('related: {} changed, {} recomputed, {} rows rewritten of {} artists'.format(
+        len(changed_idx), len(recompute_idx), len(related_data), n))
+
+    return related_data, make_state(ids, features, bounds, related, k)
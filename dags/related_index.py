@@ -0,0 +1,142 @@
+import logging
+import pickle
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from related_distance import pairwise_distances, related_rows, top_k
+from related_parallel import parallel_nearest_artists
+
+# 한 번에 query 하는 아티스트 수 (결과 배열 메모리 제한용)
+QUERY_ROWS = 50000
+
+
+# 정규화된 audio feature 벡터에 대한 KD-tree 기반 이웃 검색 인덱스
+# - 거리는 기존과 같은 L1 (수치별 |x - y|의 합) 이므로 p=1로 검색
+# - eps: 0이면 정확한 검색, 클수록 빠르지만 k번째 이웃이 실제보다 최대 (1 + eps)배 멀 수 있음
+# - leafsize: 트리 leaf 크기 (빌드/검색 속도 조절)
+class NeighbourIndex:
+    def __init__(self, ids, features, leafsize=16):
+        self.ids = list(ids)
+        self.features = np.ascontiguousarray(features, dtype=np.float64)
+        self.leafsize = leafsize
+        self.tree = cKDTree(self.features, leafsize=leafsize)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # 인덱스 파일 저장/불러오기
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            index = pickle.load(f)
+        if not isinstance(index, cls):
+            raise TypeError('not a NeighbourIndex file: {}'.format(path))
+        return index
+
+    # features 각 행에 대해 거리가 0이 아닌 가장 가까운 k개의 (인덱스, 거리)
+    # 결과가 k개보다 적은 행은 인덱스 -1, 거리 inf로 채움
+    def query(self, features, k=5, eps=0.0, workers=-1):
+        features = np.atleast_2d(np.asarray(features, dtype=np.float64))
+        n = len(self.ids)
+        idx = np.full((len(features), k), -1, dtype=np.intp)
+        dist = np.full((len(features), k), np.inf)
+
+        # 자기 자신(거리 0)이 포함되므로 1개 더 검색하고,
+        # 거리 0인 아티스트가 더 많은 행만 개수를 늘려 다시 검색
+        rows = np.arange(len(features))
+        kk = k + 1
+        while len(rows):
+            kk = min(kk, n)
+            d, i = self.tree.query(features[rows], k=kk, p=1, eps=eps, workers=workers)
+            d = d.reshape(len(rows), kk)
+            i = i.reshape(len(rows), kk)
+            d[d == 0] = np.inf
+
+            # 거리 -> 인덱스 순으로 정렬
+            order = np.lexsort((i, d), axis=1)
+            d = np.take_along_axis(d, order, axis=1)[:, :k]
+            i = np.take_along_axis(i, order, axis=1)[:, :k]
+            m = d.shape[1]
+            dist[rows, :m] = d
+            idx[rows, :m] = np.where(np.isfinite(d), i, -1)
+
+            found = np.isfinite(d).sum(axis=1)
+            if kk >= n:
+                break
+            rows = rows[found < k]
+            kk *= 2
+
+        return idx, dist
+
+    # 인덱스에 들어 있는 모든 아티스트의 관련 아티스트 (nearest_artists와 같은 형식)
+    def nearest_artists(self, k=5, eps=0.0, workers=-1, query_rows=QUERY_ROWS):
+        related_data = []
+        for start in range(0, len(self.ids), query_rows):
+            stop = min(start + query_rows, len(self.ids))
+            idx, dist = self.query(self.features[start:stop], k=k, eps=eps, workers=workers)
+            for r in range(stop - start):
+                related_data.append(related_rows(self.ids, start + r, idx[r], dist[r]))
+
+        return related_data
+
+    # 표본 아티스트에 대해 정확한 검색(전체 거리 계산)과 비교한 recall 리포트
+    def recall_report(self, k=5, eps=0.0, sample=1000, seed=0, workers=-1):
+        rng = np.random.default_rng(seed)
+        sample = min(sample, len(self.ids))
+        rows = np.sort(rng.choice(len(self.ids), size=sample, replace=False))
+
+        start = time.time()
+        exact_idx, exact_dist = top_k(pairwise_distances(self.features[rows], self.features), k)
+        exact_seconds = time.time() - start
+
+        start = time.time()
+        approx_idx, approx_dist = self.query(self.features[rows], k=k, eps=eps, workers=workers)
+        index_seconds = time.time() - start
+
+        hits = 0
+        total = 0
+        for r in range(sample):
+            expected = set(exact_idx[r][np.isfinite(exact_dist[r])])
+            hits += len(expected & set(approx_idx[r][np.isfinite(approx_dist[r])]))
+            total += len(expected)
+
+        return {
+            'k': k,
+            'eps': eps,
+            'leafsize': self.leafsize,
+            'artists': len(self.ids),
+            'sample': sample,
+            'recall': hits / total if total else 1.0,
+            'exact_seconds': exact_seconds,
+            'index_seconds': index_seconds
+        }
+
+
+# config.ini의 [RELATED] 설정에 따라 관련 아티스트 계산
+# method = exact (전체 거리 계산, 기본값) | index (KD-tree 검색)
+# workers, memory_limit_mb: exact 계산의 프로세스 수 (0이면 CPU 수), 전체 worker 메모리 상한
+# eps, leafsize: 인덱스 검색의 정확도/속도 조절, recall_sample: 0보다 크면 recall 리포트를 로그로 남김
+def compute_related(ids, features, config, k=5):
+    if config.get('RELATED', 'method', fallback='exact') != 'index':
+        return parallel_nearest_artists(ids, features, k=k,
+                                        workers=config.getint('RELATED', 'workers', fallback=1),
+                                        memory_limit=config.getint('RELATED', 'memory_limit_mb', fallback=512) << 20)
+
+    eps = config.getfloat('RELATED', 'eps', fallback=0.0)
+    index = NeighbourIndex(ids, features, leafsize=config.getint('RELATED', 'leafsize', fallback=16))
+
+    recall_sample = config.getint('RELATED', 'recall_sample', fallback=0)
+    if recall_sample > 0:
+        logging.info('related index recall: {}'.format(index.recall_report(k=k, eps=eps, sample=recall_sample)))
+
+    index_path = config.get('RELATED', 'index_path', fallback='')
+    if index_path:
+        index.save(index_path)
+
+    return index.nearest_artists(k=k, eps=eps)
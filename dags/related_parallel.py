@@ -0,0 +1,76 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from related_distance import block_distances, block_rows, nearest_artists, related_rows, top_k
+
+# 전체 worker가 거리 계산에 쓰는 메모리 상한 기본값 (byte)
+MEMORY_LIMIT = 512 * 1024 * 1024
+
+# 블록 하나를 계산할 때 n x rows 크기 배열이 동시에 몇 개 있는지 (거리, 차이, argpartition 결과)
+BLOCK_ARRAYS = 3
+
+# worker 프로세스마다 한 번만 연결하는 공유 feature 행렬 (행 우선 배열과 열 우선(전치) 배열)
+_shm = None
+_features = None
+_columns = None
+_k = None
+
+
+def _init_worker(name, shape, k):
+    global _shm, _features, _columns, _k
+    _shm = shared_memory.SharedMemory(name=name)
+    _features = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+    _columns = np.ndarray(shape[::-1], dtype=np.float64, buffer=_shm.buf, offset=_features.nbytes)
+    _k = k
+
+
+# 블록 하나의 거리 계산 후 행별 top-k만 리턴 (n x rows 거리 행렬은 worker 안에서 버림)
+def _block_top_k(bounds):
+    start, stop = bounds
+    idx, dist = top_k(block_distances(_features, start, stop, _columns), _k)
+    return start, idx, dist
+
+
+# worker 수, 메모리 상한에 맞는 블록 행 수
+def parallel_block_rows(n, workers, memory_limit=MEMORY_LIMIT):
+    return block_rows(n, memory_limit // (workers * BLOCK_ARRAYS))
+
+
+# nearest_artists와 같은 결과를 여러 프로세스로 계산
+# - feature 행렬(과 전치 배열)은 shared memory에 한 번만 올리고, worker는 복사 없이 같은 메모리를 읽음
+# - 행 블록마다 worker 안에서 top-k로 줄인 결과만 돌려받음
+# - 블록 크기는 memory_limit(전체 worker 합계)를 넘지 않도록 정함
+# 행마다 계산하는 값이 블록 크기와 무관하므로 단일 프로세스 실행과 결과가 같음
+def parallel_nearest_artists(ids, features, k=5, workers=None, memory_limit=MEMORY_LIMIT):
+    features = np.ascontiguousarray(features, dtype=np.float64)
+    n = len(ids)
+    workers = workers or os.cpu_count() or 1
+    rows = parallel_block_rows(n, workers, memory_limit)
+
+    if workers <= 1 or n <= rows:
+        return nearest_artists(ids, features, k=k, block_bytes=memory_limit // BLOCK_ARRAYS)
+
+    shm = shared_memory.SharedMemory(create=True, size=2 * features.nbytes)
+    try:
+        shared = np.ndarray(features.shape, dtype=np.float64, buffer=shm.buf)
+        shared[:] = features
+        columns = np.ndarray(features.shape[::-1], dtype=np.float64, buffer=shm.buf, offset=features.nbytes)
+        columns[:] = features.T
+
+        blocks = [(start, min(start + rows, n)) for start in range(0, n, rows)]
+        related_data = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(shm.name, features.shape, k)) as executor:
+            # map은 블록 순서대로 결과를 리턴
+            for start, idx, dist in executor.map(_block_top_k, blocks):
+                for r in range(len(idx)):
+                    related_data.append(related_rows(ids, start + r, idx[r], dist[r]))
+        del shared, columns
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return related_data
@@ -0,0 +1,135 @@
+import logging
+
+# related_artists 테이블에 쓰는 컬럼 (날짜는 테이블에서 삽입 시점 timestamp로 설정)
+RELATED_COLUMNS = ['artist_id', 'related_artist_id', 'distance']
+
+# 한 번의 INSERT / commit에 넣는 row 수
+CHUNK_SIZE = 1000
+
+
+# 챗봇의 관련 아티스트 조회 (where artist_id = ? order by distance limit k) 용 인덱스
+RELATED_INDEX = 'idx_related_artists_artist_distance'
+
+
+# 인덱스가 없으면 생성 (MySQL에는 CREATE INDEX IF NOT EXISTS가 없으므로 information_schema 확인)
+def ensure_related_index(conn, table='related_artists'):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+            (table, RELATED_INDEX))
+        if not cursor.fetchall():
+            cursor.execute("CREATE INDEX %s ON %s (artist_id, distance)" % (RELATED_INDEX, table))
+            logging.info('{}: created index {}'.format(table, RELATED_INDEX))
+    finally:
+        cursor.close()
+
+
+# 여러 row를 한 번에 넣는 INSERT ... ON DUPLICATE KEY UPDATE 문
+def upsert_sql(table, columns, n_rows):
+    row = '( {} )'.format(', '.join(['%s'] * len(columns)))
+    updates = ', '.join(['{0}=VALUES({0})'.format(c) for c in columns])
+    return "INSERT INTO %s ( %s ) VALUES %s ON DUPLICATE KEY UPDATE %s" % (
+        table, ', '.join(columns), ', '.join([row] * n_rows), updates)
+
+
+def execute_upsert(cursor, table, rows, columns=RELATED_COLUMNS):
+    if not rows:
+        return
+    values = [row[c] for row in rows for c in columns]
+    cursor.execute(upsert_sql(table, columns, len(rows)), values)
+
+
+def execute_delete(cursor, table, artist_ids):
+    if not artist_ids:
+        return
+    sql = "DELETE FROM %s WHERE artist_id IN ( %s )" % (table, ', '.join(['%s'] * len(artist_ids)))
+    cursor.execute(sql, artist_ids)
+
+
+# 관련 아티스트 목록이 비게 된 아티스트 표시 (빈 목록으로는 artist_id를 알 수 없으므로)
+# related_artist_id가 None인 row 하나: 기존 row 삭제만 하고 upsert 하지 않음
+def cleared_rows(artist_id):
+    return [{'artist_id': artist_id, 'related_artist_id': None, 'distance': None}]
+
+
+# 아티스트 단위로 row를 묶어 chunk_size 정도씩 나눔 (한 아티스트의 row는 같은 chunk에)
+# cleared_rows로 표시된 아티스트는 artist_ids(삭제 대상)에만 들어감
+def artist_chunks(related_data, chunk_size=CHUNK_SIZE):
+    artist_ids = []
+    rows = []
+    for data in related_data:
+        if not data:
+            continue
+        artist_ids.append(data[0]['artist_id'])
+        rows.extend(row for row in data if row['related_artist_id'] is not None)
+        if len(rows) >= chunk_size or len(artist_ids) >= chunk_size:
+            yield artist_ids, rows
+            artist_ids, rows = [], []
+    if artist_ids:
+        yield artist_ids, rows
+
+
+# 아티스트별 관련 아티스트 목록을 chunk 단위로 교체
+# chunk마다 기존 row 삭제 + multi-row upsert 후 commit 하므로,
+# 읽는 쪽에서는 한 아티스트의 목록이 반만 바뀐 상태를 보지 않음
+def replace_related(conn, related_data, table='related_artists', chunk_size=CHUNK_SIZE):
+    cursor = conn.cursor()
+    written = 0
+    try:
+        for artist_ids, rows in artist_chunks(related_data, chunk_size):
+            execute_delete(cursor, table, artist_ids)
+            execute_upsert(cursor, table, rows)
+            conn.commit()
+            written += len(rows)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    return written
+
+
+# 전체 결과를 shadow 테이블에 먼저 쓰고, RENAME TABLE로 한 번에 교체
+# RENAME은 원자적으로 실행되므로 읽는 쪽에서는 이전 테이블 또는 새 테이블 전체만 보임
+def swap_related(conn, related_data, table='related_artists', chunk_size=CHUNK_SIZE):
+    shadow = table + '_shadow'
+    old = table + '_old'
+
+    cursor = conn.cursor()
+    try:
+        # 인덱스/기본값까지 같은 빈 테이블 생성
+        cursor.execute("DROP TABLE IF EXISTS %s" % shadow)
+        cursor.execute("CREATE TABLE %s LIKE %s" % (shadow, table))
+
+        written = 0
+        for _, rows in artist_chunks(related_data, chunk_size):
+            execute_upsert(cursor, shadow, rows)
+            conn.commit()
+            written += len(rows)
+
+        cursor.execute("DROP TABLE IF EXISTS %s" % old)
+        cursor.execute("RENAME TABLE %s TO %s, %s TO %s" % (table, old, shadow, table))
+        cursor.execute("DROP TABLE %s" % old)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    logging.info('{}: swapped in {} rows'.format(table, written))
+    return written
+
+
+# config.ini [RELATED] 설정에 따라 결과 저장
+# - write_chunk: chunk 크기
+# - swap = true: 전체 결과를 shadow 테이블에 쓰고 교체 (incremental 결과처럼 일부만 있을 때는 사용하지 않음)
+# shadow 테이블은 CREATE TABLE ... LIKE 로 만들기 때문에 인덱스도 그대로 따라감
+def store_related(conn, related_data, config, full=True):
+    ensure_related_index(conn)
+    chunk_size = config.getint('RELATED', 'write_chunk', fallback=CHUNK_SIZE)
+    if full and config.getboolean('RELATED', 'swap', fallback=False):
+        return swap_related(conn, related_data, chunk_size=chunk_size)
+    return replace_related(conn, related_data, chunk_size=chunk_size)
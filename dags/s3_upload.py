@@ -0,0 +1,89 @@
+import base64
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+# 이 크기보다 크면 multipart upload (S3 part 최소 크기는 5MB)
+PART_SIZE = 8 * 1024 * 1024
+
+
+def sha256_b64(data):
+    return base64.b64encode(hashlib.sha256(data).digest()).decode('ascii')
+
+
+class ChecksumMismatch(Exception):
+    def __init__(self, key, expected, actual):
+        super().__init__('s3 checksum mismatch for {}: expected {}, got {}'.format(key, expected, actual))
+        self.key = key
+        self.expected = expected
+        self.actual = actual
+
+
+# 메모리에 있는 bytes를 로컬 파일 없이 바로 S3에 올림
+# - 요청마다 SHA256 checksum을 같이 보내서 S3가 받은 내용을 검증 (다르면 S3가 요청을 거부)
+# - 완료 후 S3가 돌려준 checksum도 로컬에서 계산한 값과 비교
+# - part_size보다 크면 multipart upload, part들은 workers개씩 동시에 올림 (실패하면 abort)
+# - upload_all: 여러 객체를 동시에 올림
+class S3Uploader:
+    def __init__(self, s3=None, part_size=PART_SIZE, workers=4):
+        self.s3 = s3 or boto3.client('s3')
+        self.part_size = part_size
+        self.workers = workers
+
+    def upload(self, bucket, key, data):
+        if len(data) <= self.part_size:
+            return self._put(bucket, key, data)
+        return self._multipart(bucket, key, data)
+
+    # objects: {key: bytes}
+    def upload_all(self, bucket, objects):
+        with ThreadPoolExecutor(max_workers=max(1, len(objects))) as executor:
+            futures = {key: executor.submit(self.upload, bucket, key, data) for key, data in objects.items()}
+            return {key: future.result() for key, future in futures.items()}
+
+    def _put(self, bucket, key, data):
+        checksum = sha256_b64(data)
+        response = self.s3.put_object(Bucket=bucket, Key=key, Body=data,
+                                      ChecksumAlgorithm='SHA256', ChecksumSHA256=checksum)
+        self._verify(key, checksum, response)
+        return checksum
+
+    def _multipart(self, bucket, key, data):
+        view = memoryview(data)
+        ranges = [(n + 1, start, min(start + self.part_size, len(data)))
+                  for n, start in enumerate(range(0, len(data), self.part_size))]
+
+        upload_id = self.s3.create_multipart_upload(Bucket=bucket, Key=key, ChecksumAlgorithm='SHA256')['UploadId']
+
+        def upload_part(part):
+            number, start, stop = part
+            body = bytes(view[start:stop])
+            digest = hashlib.sha256(body).digest()
+            response = self.s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number,
+                                           Body=body, ChecksumAlgorithm='SHA256',
+                                           ChecksumSHA256=base64.b64encode(digest).decode('ascii'))
+            return digest, {'ETag': response['ETag'], 'PartNumber': number,
+                            'ChecksumSHA256': base64.b64encode(digest).decode('ascii')}
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                parts = list(executor.map(upload_part, ranges))
+
+            response = self.s3.complete_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': [part for _, part in parts]})
+        except Exception:
+            self.s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+            raise
+
+        # multipart 객체의 checksum은 part checksum들을 이어 붙인 것의 checksum + '-part 수'
+        checksum = '{}-{}'.format(sha256_b64(b''.join(digest for digest, _ in parts)), len(parts))
+        self._verify(key, checksum, response)
+        return checksum
+
+    @staticmethod
+    def _verify(key, checksum, response):
+        actual = response.get('ChecksumSHA256')
+        if actual is not None and actual != checksum:
+            raise ChecksumMismatch(key, checksum, actual)
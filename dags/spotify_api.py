@@ -0,0 +1,167 @@
+import base64
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# lambda/chatbot/spotify_api.py 는 이 파일의 심볼릭 링크 (Lambda 배포 zip에 함께 포함)
+
+TOKEN_URL = "https://accounts.spotify.com/api/token"
+API_URL = "https://api.spotify.com/v1/"
+
+# 토큰 만료 전에 미리 갱신하는 여유 시간 (초)
+REFRESH_MARGIN = 60
+
+
+# Spotify API 헤더에 들어가는 Token 관리
+# 발급받은 토큰을 expires_in 동안 재사용하고, 만료 직전 또는 401 응답 후에만 다시 발급
+# 여러 스레드에서 같이 써도 토큰 발급은 한 번만 일어남
+class SpotifyAuth:
+    def __init__(self, client_id, client_secret, refresh_margin=REFRESH_MARGIN, timeout=10):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self.token_requests = 0  # 토큰 발급 요청 횟수
+
+        self._lock = threading.Lock()
+        self._cached = (None, 0.0)  # (access_token, 만료 시각(monotonic))
+
+    def _request_token(self):
+        encoded = base64.b64encode("{}:{}".format(self.client_id, self.client_secret).encode('utf-8')).decode('ascii')
+
+        headers = {"Authorization": "Basic {}".format(encoded)}
+        payload = {"grant_type": "client_credentials"}
+
+        response = requests.post(TOKEN_URL, data=payload, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        self.token_requests += 1
+
+        return data['access_token'], time.monotonic() + data.get('expires_in', 3600) - self.refresh_margin
+
+    def token(self):
+        access_token, expires_at = self._cached
+        if access_token and time.monotonic() < expires_at:
+            return access_token
+
+        with self._lock:
+            # 기다리는 동안 다른 스레드가 이미 갱신했을 수 있음
+            access_token, expires_at = self._cached
+            if not access_token or time.monotonic() >= expires_at:
+                self._cached = self._request_token()
+            return self._cached[0]
+
+    def headers(self):
+        return {"Authorization": "Bearer {}".format(self.token())}
+
+    # 401 응답을 받았을 때 호출: 다음 요청에서 토큰을 새로 발급
+    # access_token을 넘기면, 그 사이 다른 스레드가 이미 갱신한 토큰은 버리지 않음
+    def invalidate(self, access_token=None):
+        with self._lock:
+            if access_token is None or access_token == self._cached[0]:
+                self._cached = (None, 0.0)
+
+
+# 초당 요청 수 제한 (여러 스레드가 공유하는 전역 제한)
+# 요청 시각을 1 / max_rps 간격으로 예약해서, 순간적으로 몰리지 않게 함
+class RateLimiter:
+    def __init__(self, max_rps):
+        self.interval = 1.0 / max_rps
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+# Spotify Web API 호출용 클라이언트
+# - 하나의 Session(connection pool)을 재사용해서 매 호출마다 TCP/TLS 연결을 새로 맺지 않음
+# - 5xx, 연결 오류: jitter를 준 exponential backoff 후 재시도
+# - 429: Retry-After 헤더만큼 기다린 후 재시도 (max_retry_after 초과 시 실패)
+# - 401: 토큰을 새로 발급받아 한 번 재시도
+# - max_rps: 0보다 크면 이 클라이언트를 쓰는 모든 스레드의 초당 요청 수 합을 제한
+class SpotifyClient:
+    def __init__(self, auth, pool_size=10, timeout=(3.05, 10), max_retries=5,
+                 backoff=0.5, max_backoff=30, max_retry_after=60, max_rps=0):
+        self.auth = auth
+        self.limiter = RateLimiter(max_rps) if max_rps > 0 else None
+        self.timeout = timeout  # (connect, read) 초
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.requests = 0  # 실제 HTTP 요청 횟수
+        self.retries = 0  # 재시도 횟수
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+
+    def _sleep_backoff(self, attempt):
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    # path: 'search', 'artists/{id}/top-tracks' 처럼 API_URL 뒤의 경로 또는 전체 URL
+    # 성공하면 JSON을 dict로 리턴, 재시도 후에도 실패하면 requests.HTTPError
+    def get(self, path, params=None):
+        url = path if path.startswith('https://') else API_URL + path.lstrip('/')
+        attempt = 0
+        refreshed = False
+
+        while True:
+            access_token = self.auth.token()
+            headers = {"Authorization": "Bearer {}".format(access_token)}
+            if self.limiter:
+                self.limiter.wait()
+            self.requests += 1
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                self.retries += 1
+                self._sleep_backoff(attempt)
+                attempt += 1
+                continue
+
+            # token expired
+            if response.status_code == 401 and not refreshed:
+                self.auth.invalidate(access_token)
+                refreshed = True
+                self.retries += 1
+                continue
+
+            # 너무 많은 요청
+            if response.status_code == 429 and attempt < self.max_retries:
+                retry_after = response.headers.get('Retry-After')
+                wait = int(retry_after) if retry_after and retry_after.isdigit() else None
+                if wait is not None and wait > self.max_retry_after:
+                    logging.error('spotify rate limited for {}s: {}'.format(wait, url))
+                    response.raise_for_status()
+                self.retries += 1
+                if wait is None:
+                    self._sleep_backoff(attempt)
+                else:
+                    time.sleep(wait)
+                attempt += 1
+                continue
+
+            if response.status_code >= 500 and attempt < self.max_retries:
+                self.retries += 1
+                self._sleep_backoff(attempt)
+                attempt += 1
+                continue
+
+            if response.status_code != 200:
+                logging.error('spotify api error {}: {}'.format(response.status_code, response.text))
+            response.raise_for_status()
+
+            return response.json()
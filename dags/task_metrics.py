@@ -0,0 +1,98 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+# 이전 실행보다 이 비율 이상 나빠지면 regression으로 표시
+REGRESSION_RATIO = 0.5
+
+# 값이 작으면 비교하지 않음 (짧은 단계의 흔들림은 무시)
+MIN_SECONDS = 1.0
+
+# 건수 값은 이전 실행과의 차이가 이보다 작으면 비교하지 않음 (예: 토큰 재발급 1 -> 2, API 호출 2 -> 4)
+MIN_CHANGE = 10
+
+
+# task 하나의 지표 기록
+# - add / set: 건수, byte, API 호출 수 등
+# - phase: 단계별 소요 시간 (초)
+# - publish: 로그 한 줄(JSON)로 남기고 XCom(key='metrics')에 올림
+class TaskMetrics:
+    def __init__(self, task):
+        self.task = task
+        self.values = {}
+        self.timings = {}
+        self._start = time.monotonic()
+
+    def add(self, name, value=1):
+        self.values[name] = self.values.get(name, 0) + value
+
+    def set(self, name, value):
+        self.values[name] = value
+
+    def update(self, values, prefix=''):
+        for name, value in values.items():
+            self.set(prefix + name, value)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + time.monotonic() - start
+
+    def record(self):
+        return {
+            'task': self.task,
+            'values': self.values,
+            'timings': {name: round(seconds, 3) for name, seconds in self.timings.items()},
+            'seconds': round(time.monotonic() - self._start, 3)
+        }
+
+    def publish(self, context):
+        record = self.record()
+        logging.info('task metrics {}'.format(json.dumps(record, sort_keys=True)))
+        context['ti'].xcom_push(key='metrics', value=record)
+        return record
+
+
+# 늘어나면 나빠진 것으로 보는 값 / 줄어들면 나빠진 것으로 보는 값 (이름의 마지막 부분 기준, 예: athena.queue_ms)
+INCREASE_IS_BAD = ('retries', 'api_calls', 'token_requests', 'queue_ms', 'engine_ms', 'scanned_bytes')
+DECREASE_IS_BAD = ('rows', 'artists', 'tracks', 'bytes', 'related_lists', 'rows_written', 'bundles')
+
+# incremental 실행(values의 incremental = true)은 바뀐 목록만 쓰므로 날마다 크게 달라지는 값
+INCREMENTAL_VALUES = ('related_lists', 'rows_written')
+
+
+# 이전 실행과 비교해서 나빠진 값 목록
+# - 시간(seconds, timings): 이전보다 ratio 이상 늘어남
+# - values: INCREASE_IS_BAD는 ratio 이상 늘어남, DECREASE_IS_BAD는 ratio 이상 줄어듦 (차이가 MIN_CHANGE 이상일 때만)
+#   이번 또는 이전 실행이 incremental이면 INCREMENTAL_VALUES는 비교하지 않음
+def regressions(current, previous, ratio=REGRESSION_RATIO):
+    found = []
+    for task, record in current.items():
+        before = previous.get(task)
+        if not before:
+            continue
+
+        times = [('seconds', record['seconds'], before.get('seconds'))]
+        times += [('timings.' + name, value, before.get('timings', {}).get(name))
+                  for name, value in record['timings'].items()]
+        for name, now, then in times:
+            if then and max(now, then) >= MIN_SECONDS and now > then * (1 + ratio):
+                found.append({'task': task, 'metric': name, 'previous': then, 'current': now})
+
+        incremental = record['values'].get('incremental') or before.get('values', {}).get('incremental')
+        for name, now in record['values'].items():
+            then = before.get('values', {}).get(name)
+            if not isinstance(now, (int, float)) or not isinstance(then, (int, float)) or not then:
+                continue
+            kind = name.split('.')[-1]
+            if abs(now - then) < MIN_CHANGE or (incremental and kind in INCREMENTAL_VALUES):
+                continue
+            if (kind in INCREASE_IS_BAD and now > then * (1 + ratio)) or \
+                    (kind in DECREASE_IS_BAD and now < then * (1 - ratio)):
+                found.append({'task': task, 'metric': 'values.' + name, 'previous': then, 'current': now})
+
+    return found
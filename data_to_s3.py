@@ -1,13 +1,20 @@
-import base64
+import io
 import json, jsonpath, pymysql
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import boto3
-import pandas as pd
-import requests
 
 import configparser
+import os
+
+# Spotify API 모듈은 Airflow dags 폴더와 공유
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dags'))
+from feature_store import download_store, upload_store
+from parquet_stream import AUDIO_FEATURES_SCHEMA, TOP_TRACKS_SCHEMA, ParquetStreamWriter, batched
+from s3_upload import S3Uploader
+from spotify_api import SpotifyAuth, SpotifyClient
 
 # config.ini 불러오기
 config = configparser.ConfigParser()
@@ -16,6 +23,15 @@ config.read('config.ini', encoding='utf-8')
 client_id = config['API']['client_id']
 client_secret = config['API']['client_secret']
 
+# 동시 crawl 설정: workers (동시 요청 수, 1이면 순차 실행), max_rps (전체 초당 요청 수 제한, 0이면 제한 없음)
+workers = config.getint('CRAWL', 'workers', fallback=1)
+max_rps = config.getfloat('CRAWL', 'max_rps', fallback=0)
+
+# API 헤더에 들어가는 Token: 만료 전까지 재사용
+auth = SpotifyAuth(client_id, client_secret)
+# Spotify API 호출 (연결 재사용, 429/401/5xx 재시도)
+spotify = SpotifyClient(auth, pool_size=max(10, workers), max_rps=max_rps)
+
 try:
     con = pymysql.connect(host=config['DB']['host'],
                           user=config['DB']['user'],
@@ -29,21 +45,6 @@ except:
     logging.error("mysql connection error")
     sys.exit(1)
 
-def get_token(client_id, client_secret):
-    endpoint = "https://accounts.spotify.com/api/token"
-
-    encoded = base64.b64encode("{}:{}".format(client_id, client_secret).encode('utf-8')).decode('ascii')
-
-    headers = {"Authorization": "Basic {}".format(encoded)}
-    payload = {"grant_type": "client_credentials"}
-
-    response = requests.post(endpoint, data=payload, headers=headers)
-    access_token = json.loads(response.text)['access_token']
-
-    headers = {"Authorization": "Bearer {}".format(access_token)}
-
-    return headers
-
 
 def invoke_lambda(fxn_name, payload, invocation_type='Event'):
     # invocation_type -> 'Event': 비동기, 'RequestResponse': 동기
@@ -57,78 +58,99 @@ def invoke_lambda(fxn_name, payload, invocation_type='Event'):
     return invoke_response
 
 
-def main():
-    cur.execute("SELECT artist_id, artist_name FROM artists")
+top_track_keys = {
+    "track_id": "id",
+    "track_name": "name",
+    "popularity": "popularity",
+    "album_name": "album.name",
+    "image_url": "album.images[1].url"
+}
+
+
+# 아티스트 한 명의 Top Track Data Flatten
+def fetch_top_tracks(artist):
+    a_id, a_name = artist
+    query_params = {'market': 'KR'}
+    data = spotify.get('artists/{}/top-tracks'.format(a_id), params=query_params)
 
-    top_track_keys = {
-        "track_id": "id",
-        "track_name": "name",
-        "popularity": "popularity",
-        "album_name": "album.name",
-        "image_url": "album.images[1].url"
-    }
+    # # Update DynamodDB Data
+    # response = invoke_lambda('dynamo-function', payload={
+    #     'data': data
+    # })
 
     top_tracks = []
-    audio_features = []
-
-    # Top Track Data Flatten
-    for (a_id, a_name) in cur.fetchall():
-        endpoint = "https://api.spotify.com/v1/artists/{}/top-tracks".format(a_id)
-        headers = get_token(client_id, client_secret)
-        query_params = {'market': 'KR'}
-        response = requests.get(endpoint, params=query_params, headers=headers)
-        data = json.loads(response.text)
-
-        # # Update DynamodDB Data
-        # response = invoke_lambda('dynamo-function', payload={
-        #     'data': data
-        # })
-
-        for track in data['tracks']:
-            n_track = {}
-            for k, v in top_track_keys.items():
-                value = jsonpath.jsonpath(track, v)
-                if type(value) == bool:
-                    continue
-                n_track.update({k: value[0]})
-                n_track.update({'artist_id': a_id})
-                n_track.update({'artist_name': a_name})
-
-            top_tracks.append(n_track)
-
-    track_ids = [track['track_id'] for track in top_tracks]
-    print(top_tracks)
-    # audio Feature API 호출을 track id 100개씩 묶어 처리
-    list_track_id_binds = [track_ids[i:i + 100] for i in range(0, len(track_ids), 100)]
+    for track in data['tracks']:
+        n_track = {}
+        for k, v in top_track_keys.items():
+            value = jsonpath.jsonpath(track, v)
+            if type(value) == bool:
+                continue
+            n_track.update({k: value[0]})
+            n_track.update({'artist_id': a_id})
+            n_track.update({'artist_name': a_name})
+
+        top_tracks.append(n_track)
+
+    return top_tracks
+
 
-    for track_id_bind in list_track_id_binds:
-        ids = ','.join(track_id_bind)
-        endpoint = "https://api.spotify.com/v1/audio-features/?ids={}".format(ids)
-        headers = get_token(client_id, client_secret)
-        response = requests.get(endpoint, headers=headers)
-        data = json.loads(response.text)
+# track id 100개 묶음의 audio feature
+def fetch_audio_features(track_id_bind):
+    ids = ','.join(track_id_bind)
+    data = spotify.get('audio-features', params={'ids': ids})
+    return data['audio_features']
 
-        audio_features.extend(data['audio_features'])
 
-    # to DataFrame -> parquet File
-    top_tracks = pd.DataFrame(top_tracks)
-    audio_features = pd.DataFrame(audio_features)
+# items 각각에 func 호출. workers > 1 이면 스레드 풀로 동시에 호출
+# 결과는 항상 items 순서대로 하나씩 리턴 (순차 실행과 같은 parquet 파일이 나오도록)
+def crawl(func, items, workers=1):
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(func, items)
 
-    top_tracks.to_parquet('top-tracks.parquet', engine="pyarrow", compression="snappy")
-    audio_features.to_parquet('audio-features.parquet', engine="pyarrow", compression="snappy")
 
-    # to s3
-    s3 = boto3.resource('s3')
+def main():
+    cur.execute("SELECT artist_id, artist_name FROM artists")
+
+    # Top Track Data Flatten (아티스트 순서 유지)
+    # 아티스트별 결과를 모아 두지 않고 바로 parquet row group으로 씀 (track id만 남김)
+    track_ids = []
+    top_tracks = io.BytesIO()
+    with ParquetStreamWriter(top_tracks, TOP_TRACKS_SCHEMA) as writer:
+        for tracks in batched(crawl(fetch_top_tracks, cur.fetchall(), workers), 100):
+            tracks = [track for artist_tracks in tracks for track in artist_tracks]
+            writer.write(tracks)
+            track_ids.extend(track['track_id'] for track in tracks)
+    print('{} top tracks'.format(writer.rows))
+
+    # audio feature는 바뀌지 않으므로 저장소(S3)에 없는 트랙만 API 호출
+    store_path = config.get('CRAWL', 'feature_store_path', fallback='audio-features-store.parquet')
+    store = download_store(config['AWS']['bucket_name'], store_path)
+    missing = store.missing(track_ids)
+
+    # audio Feature API 호출을 track id 100개씩 묶어 처리
+    list_track_id_binds = [missing[i:i + 100] for i in range(0, len(missing), 100)]
+
+    for features in crawl(fetch_audio_features, list_track_id_binds, workers):
+        store.add(features)
+
+    # track id 하나에 한 행씩, 배치 단위로 parquet에 씀
+    audio_features = io.BytesIO()
+    with ParquetStreamWriter(audio_features, AUDIO_FEATURES_SCHEMA) as writer:
+        for batch in batched(dict.fromkeys(track_ids)):
+            writer.write_frame(store.select(batch))
+
+    # to s3: 메모리의 parquet을 두 파티션 동시에 올림 (checksum 검증, 큰 파일은 multipart)
     time = datetime.utcnow().strftime("%Y-%m-%d")  # 2023-01-17
-    bucket = s3.Object(config['AWS']['bucket_name'], 'top-tracks/dt={}/top_tracks.parquet'.format(time))
-    data = open('top-tracks.parquet', 'rb')
-    bucket.put(Body=data)
-
-    s3 = boto3.resource('s3')
-    time = datetime.utcnow().strftime("%Y-%m-%d")
-    bucket = s3.Object(config['AWS']['bucket_name'], 'audio-features/dt={}/audio_features.parquet'.format(time))
-    data = open('audio-features.parquet', 'rb')
-    bucket.put(Body=data)
+    S3Uploader().upload_all(config['AWS']['bucket_name'], {
+        'top-tracks/dt={}/top_tracks.parquet'.format(time): top_tracks.getvalue(),
+        'audio-features/dt={}/audio_features.parquet'.format(time): audio_features.getvalue()
+    })
+
+    upload_store(store, config['AWS']['bucket_name'], store_path)
 
 
 if __name__ == '__main__':
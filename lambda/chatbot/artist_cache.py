@@ -0,0 +1,83 @@
+import time
+from collections import OrderedDict
+
+
+# 크기 제한(LRU)과 TTL이 있는 in-process 캐시
+# Lambda 컨테이너가 warm 상태인 동안 모듈 전역 객체로 유지됨
+class TTLCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, 만료 시각)
+
+    def __len__(self):
+        return len(self._data)
+
+    # (찾았는지, 값) 리턴. 만료된 값은 지움
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return False, None
+        value, expires_at = item
+        if time.monotonic() >= expires_at:
+            del self._data[key]
+            return False, None
+        self._data.move_to_end(key)
+        return True, value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+
+# 사용자 입력(utterance) 기준 Spotify 아티스트 검색 결과 캐시
+# - 검색 결과가 있으면 artist dict를 ttl 동안 저장
+# - 검색 결과가 없으면 negative_ttl 동안만 저장 (새로 등록된 아티스트를 너무 오래 놓치지 않도록)
+class ArtistSearchCache:
+    def __init__(self, maxsize=1024, ttl=3600, negative_maxsize=256, negative_ttl=60):
+        self.found = TTLCache(maxsize, ttl)
+        self.not_found = TTLCache(negative_maxsize, negative_ttl)
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    # 대소문자, 앞뒤/중복 공백 차이는 같은 검색어로 취급
+    @staticmethod
+    def normalize(utterance):
+        return ' '.join(utterance.split()).casefold()
+
+    # 캐시에 없을 때만 search(utterance) 호출
+    def search(self, utterance, search):
+        key = self.normalize(utterance)
+
+        found, artist = self.found.get(key)
+        if found:
+            self.hits += 1
+            return artist
+
+        found, _ = self.not_found.get(key)
+        if found:
+            self.negative_hits += 1
+            return None
+
+        self.misses += 1
+        artist = search(utterance)
+        if artist:
+            self.found.set(key, artist)
+        else:
+            self.not_found.set(key, True)
+        return artist
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'size': len(self.found),
+            'negative_size': len(self.not_found)
+        }
@@ -0,0 +1 @@
+../../dags/kakao_message.py
\ No newline at end of file
@@ -1,75 +1,140 @@
+import functools
 import logging
-import time
-
-import requests
-import base64
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import boto3
 
-import logging
-import sys
-
 import pymysql
 import configparser
 
-from urllib import parse
+from datetime import datetime, timedelta
 from boto3.dynamodb.conditions import Key
 
+import tracing
+from artist_cache import ArtistSearchCache
+from kakao_message import BUNDLE_VERSION, artist_message, artist_youtube_url, list_card, message, simple_text, \
+    track_items, track_youtube_url
+from spotify_api import SpotifyAuth, SpotifyClient
+
+# 설정, 외부 서비스 클라이언트는 import 시점이 아니라 처음 사용할 때 만들고,
+# warm 컨테이너에서는 다음 요청에서도 그대로 재사용 (필요 없는 경로에서는 만들지 않음)
+
+
 # config.ini 불러 오기
-config = configparser.ConfigParser()
-config.read('config.ini', encoding='utf-8')
+@functools.lru_cache(maxsize=None)
+def get_config():
+    config = configparser.ConfigParser()
+    config.read('config.ini', encoding='utf-8')
+    return config
 
-# 유튜브 검색 결과 링크 (각 트랙 별로 parse해서 사용)
-base_url = "https://www.youtube.com/results?"
-client_id = config['API']['client_id']
-client_secret = config['API']['client_secret']
 
-tracks = ()
+# Spotify API 호출: Token은 만료 전까지, 연결(keep-alive)도 재사용
+# 카카오 스킬 응답 제한(5초) 안에 끝나도록 timeout, 재시도 대기를 짧게 둠
+@functools.lru_cache(maxsize=None)
+def get_spotify():
+    config = get_config()
+    auth = SpotifyAuth(config['API']['client_id'], config['API']['client_secret'])
+    return SpotifyClient(auth, pool_size=4, timeout=(1, 2), max_retries=1, backoff=0.2, max_retry_after=1)
 
-# DynomoDB 연결: AWS CLI Config 정보 바탕으로 boto3 사
-try:
-    dynamodb = boto3.resource("dynamodb")
-except:
-    logging.error('error: cannot connect to dynamodb')
-    sys.exit(1)
 
+# 아티스트 검색 결과 캐시: warm 컨테이너에서는 같은 검색어의 Spotify 검색을 건너뜀
+# 적중/미스 횟수는 get_artist_cache().stats()
+@functools.lru_cache(maxsize=None)
+def get_artist_cache():
+    config = get_config()
+    return ArtistSearchCache(
+        maxsize=config.getint('CACHE', 'artist_maxsize', fallback=1024),
+        ttl=config.getint('CACHE', 'artist_ttl', fallback=3600),
+        negative_maxsize=config.getint('CACHE', 'negative_maxsize', fallback=256),
+        negative_ttl=config.getint('CACHE', 'negative_ttl', fallback=60))
 
-# RDS (mysql) 연결
-try:
-    con = pymysql.connect(host=config['DB']['host'],
-                          user=config['DB']['user'],
-                          passwd=config['DB']['password'],
-                          db=config['DB']['database'],
-                          port=int(config['DB']['port']),
-                          use_unicode=True,
-                          charset='utf8')
-    cur = con.cursor()
-except:
-    logging.error("mysql connection error")
-    sys.exit(1)
 
+# DynomoDB 연결: AWS CLI Config 정보 바탕으로 boto3 사용
+@functools.lru_cache(maxsize=None)
+def get_dynamodb():
+    return boto3.resource("dynamodb")
 
-# API 헤더에 들어가는 Token
-def get_token(client_id, client_secret):
-    endpoint = "https://accounts.spotify.com/api/token"
 
-    encoded = base64.b64encode("{}:{}".format(client_id, client_secret).encode('utf-8')).decode('ascii')
+@functools.lru_cache(maxsize=None)
+def get_lambda_client():
+    return boto3.client('lambda')
 
-    headers = {"Authorization": "Basic {}".format(encoded)}
-    payload = {"grant_type": "client_credentials"}
 
-    response = requests.post(endpoint, data=payload, headers=headers)
-    access_token = json.loads(response.text)['access_token']
+tracks = ()
+
+# DynamoDB 쿼리 동시 실행용 스레드 풀 (warm 컨테이너에서 재사용)
+executor = ThreadPoolExecutor(max_workers=4)
+
+
+# RDS (mysql) 연결
+# 처음 사용할 때 연결하고, 닫힌 연결(con.open = False)은 새로 연결
+# 열려 있어도 마지막 사용 후 ping_interval(초)이 지났으면 ping으로 확인 (끊겼으면 ping(reconnect=True)이 다시 연결)
+# 쿼리 중 연결 오류가 나면 연결을 버려서 다음 요청이 새로 연결 (mysql_cursor)
+# 연결 실패는 예외로 올려서 이번 요청만 실패하고, 다음 요청에서 다시 연결을 시도
+_mysql = {'con': None, 'used_at': 0.0}
+_mysql_lock = threading.Lock()
+
+
+def mysql_connect():
+    config = get_config()
+    return pymysql.connect(host=config['DB']['host'],
+                           user=config['DB']['user'],
+                           passwd=config['DB']['password'],
+                           db=config['DB']['database'],
+                           port=int(config['DB']['port']),
+                           use_unicode=True,
+                           charset='utf8')
+
+
+def get_connection():
+    with _mysql_lock:
+        con = _mysql['con']
+        now = time.monotonic()
+        if con is None or not con.open:
+            con = mysql_connect()
+        elif now - _mysql['used_at'] > get_config().getfloat('DB', 'ping_interval', fallback=5):
+            try:
+                con.ping(reconnect=True)
+            except pymysql.Error as e:
+                logging.error('mysql ping error, reconnecting: {}'.format(e))
+                con = mysql_connect()
+        _mysql['con'] = con
+        _mysql['used_at'] = now
+        return con
+
+
+# 연결 오류가 난 연결을 버림 (그 사이 다른 스레드가 새로 연결했으면 그대로 둠)
+def drop_connection(con):
+    with _mysql_lock:
+        if _mysql['con'] is con:
+            _mysql['con'] = None
+    try:
+        con.close()
+    except pymysql.Error:
+        pass
 
-    headers = {"Authorization": "Bearer {}".format(access_token)}
 
-    return headers
+# 쿼리용 cursor, commit = True 이면 쿼리 후 commit
+@contextmanager
+def mysql_cursor(commit=False):
+    con = get_connection()
+    try:
+        with con.cursor() as cur:
+            yield cur
+        if commit:
+            con.commit()
+    except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+        drop_connection(con)
+        raise
 
 
 # Lambda Function 비동기 호출: DynamodDB로 데이터 저장 과정은 다른 람다 함수에서 처리
+@tracing.traced('invoke_lambda')
 def invoke_lambda(funcntion_name, payload, invocation_type='Event'):
-    lambda_client = boto3.client('lambda')
-    invoke_response = lambda_client.invoke(
+    invoke_response = get_lambda_client().invoke(
         FunctionName=funcntion_name,
         InvocationType=invocation_type,
         Payload=json.dumps(payload)
@@ -79,47 +144,29 @@ def invoke_lambda(funcntion_name, payload, invocation_type='Event'):
 
 
 # DB 에서 Top_Track 데이터 가져 오는 함수
+# 여러 스레드에서 동시에 호출하므로 thread-safe 한 low-level client 사용 (resource는 thread-safe 하지 않음)
+@tracing.traced('get_top_track')
 def get_top_track(artist_id, artist_name):
-    table = dynamodb.Table('artist_tracks')
     # 아티스트의 id를 기반으로 track 데이터를 읽어온다.
-    result = table.query(
+    result = get_dynamodb().meta.client.query(
+        TableName='artist_tracks',
         KeyConditionExpression=Key('artist_id').eq(artist_id)
     )
-    result['Items'].sort(key=lambda x: x['popularity'], reverse=True)
-
-    items = []
-
-    for ele in result['Items'][:3]:
-        track_name = ele['track_name']
-        query = {
-            'search_query': '{} {}'.format(artist_name, track_name)
-        }
-
-        youtube_url = base_url + parse.urlencode(query, encoding='UTF-8', doseq=True)
-
-        # ListCard 형태에 맞게 리턴
-        temp_dic = {
-            "title": track_name,
-            "description": ele['album_name'],
-            "imageUrl": ele['image_url'],
-            "link": {
-                "web": youtube_url
-            }
-        }
+    return track_items(artist_name, result['Items'])
 
-        items.append(temp_dic)
 
-    return items
+# 여러 아티스트의 Top_Track 데이터를 동시에 가져오는 함수 (artists 순서대로 리턴)
+# artists: [(artist_id, artist_name), ...]
+@tracing.traced('get_top_tracks')
+def get_top_tracks(artists):
+    return list(executor.map(lambda artist: get_top_track(*artist), artists))
 
 
 # API 로 Top_Track 데이터 검색 하는 함수
+@tracing.traced('search_top_track')
 def search_top_track(a_id, a_name):
-    url = "https://api.spotify.com/v1/artists/{}/top-tracks".format(a_id)
-    headers = get_token(client_id, client_secret)
     query_params = {'market': 'KR'}
-    result = requests.get(url, params=query_params, headers=headers)
-
-    raw = json.loads(result.text)
+    raw = get_spotify().get('artists/{}/top-tracks'.format(a_id), params=query_params)
 
     global tracks
     tracks = raw
@@ -128,11 +175,7 @@ def search_top_track(a_id, a_name):
 
     for ele in raw['tracks'][:3]:
         name = ele['name']
-        query = {
-            'search_query': '{} {}'.format(a_name, name)
-        }
-
-        youtube_url = base_url + parse.urlencode(query, encoding='UTF-8', doseq=True)
+        youtube_url = track_youtube_url(a_name, name)
 
         # ListCard 형태에 맞게 리턴
         temp_dic = {
@@ -150,29 +193,16 @@ def search_top_track(a_id, a_name):
 
 
 # API 로 Artist 데이터 검색 하는 함수
+@tracing.traced('search_artist')
 def search_artist(artist_name):
-    url = "https://api.spotify.com/v1/search"
-    headers = get_token(client_id, client_secret)
     query_params = {'q': artist_name, 'type': 'artist', 'limit': 1}
 
-    result = requests.get(url, params=query_params, headers=headers)
-
-    if result.status_code != 200:
-        logging.error(json.loads(result.text))
-        # 너무 많은 데이터
-        if result.status_code == 429:
-            retry_after = json.loads(result.headers)['retry-After']
-            time.sleep(int(retry_after))
-            result = requests.get(url, params=query_params, headers=headers)
-        # token expired
-        elif result.status_code == 401:
-            headers = get_token(client_id, client_secret)
-            result = requests.get(url, params=query_params, headers=headers)
-        # other errors
-        else:
-            logging.error(json.loads(result.text))
-
-    data = json.loads(result.text)
+    # 429(Retry-After), 401(토큰 재발급), 5xx 재시도는 SpotifyClient에서 처리
+    data = get_spotify().get('search', params=query_params)
+
+    # 검색 결과 없음
+    if not data['artists']['items']:
+        return
     artist_data = data['artists']['items'][0]
 
     artist = {
@@ -188,143 +218,96 @@ def search_artist(artist_name):
 
 
 # DB에 Artist 데이터 저장 하는 함수
+@tracing.traced('insert_artist_db')
 def insert_artist_db(artist):
     insert_query = 'insert into artists values (%s,%s,%s,%s,%s,%s)'
-    cur.execute(insert_query, (
-        artist['artist_id'], artist['artist_name'], artist['followers'], artist['popularity'], artist['artist_url'],
-        artist['image_url']))
-    con.commit()
+    with mysql_cursor(commit=True) as cur:
+        cur.execute(insert_query, (
+            artist['artist_id'], artist['artist_name'], artist['followers'], artist['popularity'],
+            artist['artist_url'], artist['image_url']))
 
 
 # DB에서 Artist 데이터 가져오는 함수
+@tracing.traced('get_artist')
 def get_artist(artist_id):
-    try:
-        sql = "select * from artists where artist_id = '{}'".format(artist_id)
-        cur.execute(sql)
-        res = cur.fetchall()[0]
+    # DB에 없으면 None, 연결 오류는 예외로 올림 (DB에 없는 아티스트로 처리하지 않음)
+    with mysql_cursor() as cur:
+        sql = "select * from artists where artist_id = %s"
+        cur.execute(sql, (artist_id,))
+        res = cur.fetchone()
         cols = [ele[0] for ele in cur.description]
 
-        return {k: v for k, v in zip(cols, res)}
-    except:
+    if res is None:
         return
+    return {k: v for k, v in zip(cols, res)}
 
 
 # DB에서 Artist 데이터 가져오는 함수
+@tracing.traced('get_artist_by_name')
 def get_artist_by_name(artist_name):
-    try:
-        sql = "select * from artists where artist_name = '{}'".format(artist_name)
-        print(sql)
-        cur.execute(sql)
-        res = cur.fetchall()[0]
+    # DB에 없으면 None, 연결 오류는 예외로 올림 (DB에 없는 아티스트로 처리하지 않음)
+    with mysql_cursor() as cur:
+        sql = "select * from artists where artist_name = %s"
+        cur.execute(sql, (artist_name,))
+        res = cur.fetchone()
         cols = [ele[0] for ele in cur.description]
 
-        return {k: v for k, v in zip(cols, res)}
-    except:
+    if res is None:
         return
+    return {k: v for k, v in zip(cols, res)}
 
 
-# DB에서 Related_Artist 데이터 가져오는 함수
-def get_related_artists_db(artist_id):
+# 파이프라인이 미리 만든 아티스트 응답 번들 (CASE 2 응답)
+# 형식 버전이 다르거나, 만든 날짜(dt)가 [BUNDLE] max_age_days(일)보다 오래됐으면 None (실시간으로 응답 생성)
+@tracing.traced('get_bundle')
+def get_bundle(artist_id):
     try:
-        sql = "select related_artist_id from spotify_chatbo_db.related_artists where artist_id = '{}' order by distance limit 3".format(
-            artist_id)
-        cur.execute(sql)
-        res = [ele[0] for ele in cur.fetchall()]  # id 목록만 리턴
-        return res
-    except:
+        item = get_dynamodb().meta.client.get_item(TableName='artist_bundles', Key={'artist_id': artist_id}).get('Item')
+    except Exception as e:
+        logging.error('bundle lookup error: {}'.format(e))
         return
 
+    if not item or int(item['version']) != BUNDLE_VERSION:
+        return
 
-# 카카오톡 응답 관련 함수
-def item_card(title, imageUrl, popularity, followers, externalUrl):
-    return {
-        "itemCard": {
-            "thumbnail": {
-                "imageUrl": imageUrl,
-                "width": 800,
-                "height": 800
-            },
-            "profile": {
-                "title": title,
-                "imageUrl": imageUrl
-
-            },
-            "itemList": [
-                {
-                    "title": "Popularity",
-                    "description": popularity
-                },
-                {
-                    "title": "Followers",
-                    "description": followers
-                }
-            ],
-            "buttons": [
-                {
-                    "label": "Spotify 검색",
-                    "action": "webLink",
-                    "webLinkUrl": externalUrl
-                }
-            ]
-        }
-    }
-
-
-# SimpleText 메시지
-def simple_text(msg):
-    return {
-        "simpleText": {
-            "text": msg
-        }
-    }
-
-
-# ListCard 메시지
-def list_card(title, imageUrl, items, externalUrl):
-    return {
-        "listCard": {
-            "header": {
-                "title": title,
-                "imageUrl": imageUrl
-            },
-            "items": items,
-            "buttons": [
-                {
-                    "label": "다른 노래도 보기",
-                    "action": "webLink",
-                    "webLinkUrl": externalUrl
-                }
-            ]
-        }
-    }
+    max_age_days = get_config().getint('BUNDLE', 'max_age_days', fallback=2)
+    oldest = (datetime.utcnow() - timedelta(days=max_age_days)).strftime("%Y-%m-%d")
+    if item['dt'] < oldest:
+        return
 
+    return item
 
-# Carousel (여러 장의 카드 메시지)
-# carousel의 type은 필요하면 수정할 수 있도록, 기본값(현재 listCard)을 넣음
-def carousel(items, card_type="listCard"):
-    return {
-        "carousel": {
-            "type": card_type,
-            "items": items
-        }
-    }
 
+# DB에서 Related_Artist 데이터 가져오는 함수
+# related_artists와 artists를 JOIN 해서, 거리순 limit개의 관련 아티스트 데이터(artists 컬럼)를 한 번의 쿼리로 리턴
+# related_artists (artist_id, distance) 인덱스 사용 (파이프라인의 related_store.ensure_related_index)
+@tracing.traced('get_related_artists')
+def get_related_artists(artist_id, limit=3):
+    sql = """
+        select a.*
+        from related_artists r
+        join artists a on a.artist_id = r.related_artist_id
+        where r.artist_id = %s
+        order by r.distance
+        limit %s
+    """
+    with mysql_cursor() as cur:
+        cur.execute(sql, (artist_id, limit))
+        cols = [ele[0] for ele in cur.description]
 
-# 챗봇 메시지
-def message(outputs):
-    return {
-        "version": "2.0",
-        "template": {
-            "outputs": outputs  # 여기에 메시지 카드들이 들어감(list로)
-        }
-    }
+        return [{k: v for k, v in zip(cols, res)} for res in cur.fetchall()]
 
 
 # 최종 response
 def response(result):
+    return raw_response(json.dumps(result))
+
+
+# 이미 JSON 문자열로 만들어진 응답 (미리 만든 응답 번들)
+def raw_response(body):
     return {
         'statusCode': 200,
-        'body': json.dumps(result),
+        'body': body,
         'headers': {
             'Access-Control-Allow-Origin': '*',
         }
@@ -334,23 +317,36 @@ def response(result):
 ####################################
 
 
+# 요청마다 단계별 소요 시간을 EMF 로그 한 줄로 남김 (환경 변수 TRACING=off 이면 꺼짐)
+@tracing.handler
 def lambda_handler(event, context):
     request_body = json.loads(event['body'])
     params = request_body['action']['params']
 
     artist_name = request_body['userRequest']['utterance'].rstrip("\n")
 
-    artist = search_artist(artist_name)
+    artist_cache = get_artist_cache()
+    misses = artist_cache.misses
+    artist = artist_cache.search(artist_name, search_artist)
+    tracing.count('artist_cache_hit', int(artist_cache.misses == misses))
 
     # 검색 결과가 없을 경우 -> 한영 변환, 띄어쓰기 조정 처리 후 다시 검색
     if not artist:
+        tracing.annotate(path='not_found')
         return
 
+    # 파이프라인에서 미리 만든 응답 번들이 있으면 그대로 응답 (DynamoDB 조회 한 번)
+    bundle = get_bundle(artist['artist_id'])
+    if bundle:
+        tracing.annotate(path='bundle')
+        return raw_response(bundle['body'])
+
     # 쿼리를 통해 기존 DB에 데이터 유무 파악
     artist_db_data = get_artist(artist['artist_id'])
 
     # CASE 1: 입력된 아티스트 데이터가 DB에 없음 (새로운 데이터 insert)
     if not artist_db_data:
+        tracing.annotate(path='new_artist')
         # 메세지 큐
         message_queue = []
 
@@ -365,7 +361,7 @@ def lambda_handler(event, context):
             'data': tracks
         })
 
-        youtube_url = 'https://www.youtube.com/results?search_query={}'.format(artist['artist_name'].replace(' ', '+'))
+        youtube_url = artist_youtube_url(artist['artist_name'])
 
         # 메세지 작성
         card_message = list_card(artist['artist_name'], artist['image_url'], temp_top_tracks, youtube_url)
@@ -378,54 +374,14 @@ def lambda_handler(event, context):
         return response(result)
 
     # CASE 2: 입력된 아티스트가 DB에 있음 (artist_db_data로 처리)
-    youtube_url = 'https://www.youtube.com/results?search_query={}'.format(
-        artist_db_data['artist_name'].replace(' ', '+'))
-
-    message_queue = []
-
-    # top_track 검색
-    top_tracks = get_top_track(artist_db_data['artist_id'], artist_db_data['artist_name'])
-
-    # 메세지 작성
-    card_message = list_card(artist_db_data['artist_name'], artist_db_data['image_url'], top_tracks, youtube_url)
-
-    item_message = item_card(artist_db_data['artist_name'], artist_db_data['image_url'], artist_db_data['popularity'],
-                             artist_db_data['followers'], artist_db_data['artist_url'])
-
-    related_artists = get_related_artists_db(artist_db_data['artist_id'])
-
-    # CASE 2-1: 입력된 아티스트의 관련 아티스트도 DB에 있음
-    if related_artists:
+    # 관련 아티스트 데이터는 related_artists - artists JOIN 한 번으로 가져옴
+    related_artists_data = get_related_artists(artist_db_data['artist_id'])
+    tracing.annotate(path='known_related' if related_artists_data else 'known_no_related')
 
-        list_card_message = []
-
-        list_card_message.append(card_message['listCard'])
-
-        for related_artist in related_artists:
-            related_artist_data = get_artist(related_artist)
-
-            rel_artist_id = related_artist_data['artist_id']
-            rel_artist_name = related_artist_data['artist_name']
-            rel_image_url = related_artist_data['image_url']
-            rel_top_tracks = get_top_track(rel_artist_id, rel_artist_name)
-            rel_youtube_url = 'https://www.youtube.com/results?search_query={}'.format(
-                rel_artist_name.replace(' ', '+'))
-
-            rel_card_message = list_card(rel_artist_name, rel_image_url, rel_top_tracks, rel_youtube_url)['listCard']
-            list_card_message.append(rel_card_message)
-
-        text_message = simple_text("{}와 연관 아티스트 노래를 들어보세요!".format(artist_db_data['artist_name']))
-
-        message_queue.append(text_message)
-        message_queue.append(item_message)
-        message_queue.append(carousel(list_card_message))
-
-    # CASE 2-1: 입력된 아티스트의 관련 아티스트는 DB에 없음
-    else:
-        text_message = simple_text("{}의 노래를 들어보세요.".format(artist_db_data['artist_name']))
-        message_queue.append(text_message)
-        message_queue.append(item_message)
-        message_queue.append(card_message)
+    # top_track 검색: 입력된 아티스트와 관련 아티스트의 DynamoDB 쿼리를 동시에 실행
+    top_tracks, *rel_top_tracks_list = get_top_tracks(
+        [(artist_db_data['artist_id'], artist_db_data['artist_name'])] +
+        [(data['artist_id'], data['artist_name']) for data in related_artists_data])
 
-    result = message(message_queue)
+    result = artist_message(artist_db_data, top_tracks, list(zip(related_artists_data, rel_top_tracks_list)))
     return response(result)
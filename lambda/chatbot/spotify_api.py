@@ -0,0 +1 @@
+../../dags/spotify_api.py
\ No newline at end of file
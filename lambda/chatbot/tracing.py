@@ -0,0 +1,115 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+# 요청 단위 단계별 지연 시간 기록
+# 요청마다 CloudWatch Embedded Metric Format(EMF) 로그 한 줄을 남기면 CloudWatch가 지표로 만들어 줌
+#
+# Lambda 환경 변수 TRACING=off 이면 꺼짐: traced / handler 데코레이터가 원래 함수를 그대로 리턴하므로
+# 감싼 함수 호출에 추가 비용이 없음
+ENABLED = os.environ.get('TRACING', 'on').lower() not in ('0', 'off', 'false', 'no')
+NAMESPACE = os.environ.get('TRACING_NAMESPACE', 'MusicChatBot')
+
+# 처리 중인 요청 (Lambda 컨테이너는 한 번에 요청 하나만 처리)
+_current = None
+
+
+class RequestTrace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations = defaultdict(float)  # 단계별 소요 시간 합 (초), 스레드에서 동시에 실행된 호출은 각각 더함
+        self.counts = defaultdict(int)  # 단계별 호출 횟수 또는 count()로 더한 값
+        self.properties = {}  # 지표가 아닌 값 (path 등)
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.durations[name] += seconds
+            self.counts[name] += 1
+
+    def count(self, name, value):
+        with self._lock:
+            self.counts[name] += value
+
+    # EMF 형식 로그 (Path 별로 지표 집계)
+    def record(self):
+        total = time.perf_counter() - self.start
+        values = {'total_ms': round(total * 1000, 3)}
+        metrics = [{'Name': 'total_ms', 'Unit': 'Milliseconds'}]
+        for name, seconds in sorted(self.durations.items()):
+            values[name + '_ms'] = round(seconds * 1000, 3)
+            metrics.append({'Name': name + '_ms', 'Unit': 'Milliseconds'})
+        for name, count in sorted(self.counts.items()):
+            values[name + '_count'] = count
+            metrics.append({'Name': name + '_count', 'Unit': 'Count'})
+
+        properties = dict(self.properties)
+        properties.setdefault('path', 'unknown')
+        return {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': [['path']],
+                    'Metrics': metrics
+                }]
+            },
+            **properties,
+            **values
+        }
+
+
+# 함수 호출 시간을 name 단계로 기록
+def traced(name):
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                trace = _current
+                if trace is not None:
+                    trace.add(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+# lambda_handler 용: 요청마다 새 기록을 시작하고, 끝나면 EMF 로그 한 줄 출력
+def handler(func):
+    if not ENABLED:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(event, context):
+        global _current
+        _current = RequestTrace()
+        try:
+            return func(event, context)
+        finally:
+            trace, _current = _current, None
+            print(json.dumps(trace.record(), ensure_ascii=False))
+
+    return wrapper
+
+
+# 지표가 아닌 값 기록 (예: path)
+def annotate(**properties):
+    trace = _current
+    if trace is not None:
+        trace.properties.update(properties)
+
+
+# 횟수 지표 기록 (예: 캐시 적중)
+def count(name, value=1):
+    trace = _current
+    if trace is not None:
+        trace.count(name, value)
@@ -1,10 +1,19 @@
 import sys, os, logging, pickle
 import boto3  # athena 필요
-import time, math  # time.sleep 사용
+import time
 from datetime import datetime
 import pymysql
 import configparser
 
+# 거리 계산 모듈은 Airflow dags 폴더와 공유
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dags'))
+from athena_runner import AthenaRunner
+from local_aggregation import aggregate_table, local_source
+from related_distance import FeatureTable
+from related_incremental import incremental_related, load_state, save_state
+from related_index import compute_related
+from related_store import store_related
+
 # config.ini 불러오기
 config = configparser.ConfigParser()
 config.read('config.ini', encoding='utf-8')
@@ -18,7 +27,6 @@ try:
                           port=int(config['DB']['port']),
                           use_unicode=True,
                           charset='utf8')# 한글처리 (charset = 'utf8')
-    cursor = conn.cursor()
 except:
     logging.error("connection error")
     sys.exit(1)
@@ -27,83 +35,11 @@ except:
 
 athena = boto3.client('athena')
 
-
-# 정규화 계산 함수
-def normalize(x, x_min, x_max):
-    normalized = (x - x_min) / (x_max - x_min)
-    return normalized
-
-
-# Athena에서 사용할 데이터 configure 하는 함수
-def query_athena(query, athena):
-    response = athena.start_query_execution(
-        QueryString=query,
-        QueryExecutionContext={
-            'Database': 'related_artists'
-        },
-        ResultConfiguration={
-            # 쿼리 결과 저장하는 위치 지정
-            'OutputLocation': 's3://spotify-music-data-bucket/related_artists',
-            'EncryptionConfiguration': {
-                'EncryptionOption': 'SSE_S3'
-            }
-        }
-    )
-
-    return response
-
-
-def get_query_result(query_id, athena):
-    response = athena.get_query_execution(
-        QueryExecutionId=str(query_id)
-    )
-
-    # 쿼리가 완료될 때까지 충분한 시간 대기
-    while response['QueryExecution']['Status']['State'] != 'SUCCEEDED':
-        if response['QueryExecution']['Status']['State'] == 'FAILED':
-            logging.error('QUERY FAILED')
-            break
-        time.sleep(5)  # 데이터의 양을 보면, Athena에서 처리 시간을 통해 어느 정도 걸리는지 알 수 있음 -> 5초
-        response = athena.get_query_execution(
-            QueryExecutionId=str(query_id)
-        )
-
-    response = athena.get_query_results(
-        QueryExecutionId=str(query_id),
-        MaxResults=1000  # Athena는 MaxResults가 1000
-    )
-
-    return response
-
-
-# 쿼리 결과 데이터 전처리
-def process_data(results):
-    data = results['ResultSet']
-    columns = [col['VarCharValue'] for col in data['Rows'][0]['Data']]
-
-    listed_results = []
-    for row in data['Rows'][1:]:
-        values = []
-        for col in row['Data']:
-            try:
-                values.append(col['VarCharValue'])  
-            except: 
-                values.append('')
-        listed_results.append(dict(zip(columns, values)))
-
-    return listed_results
-
-
-# mysql의 table에 데이터 insert 하는 함수
-def insert_row(cursor, data, table):
-    placeholders = ', '.join(['%s'] * len(data))
-    columns = ', '.join(data.keys())
-
-    key_placeholders = ', '.join(['{0}=%s'.format(k) for k in data.keys()])
-    # 기본적으로 insert 하되, 키가 같으면 update
-    sql = "INSERT INTO %s ( %s ) VALUES ( %s ) ON DUPLICATE KEY UPDATE %s" % (
-    table, columns, placeholders, key_placeholders)
-    cursor.execute(sql, list(data.values()) * 2)  # *2: values()와 on duplicate key update에 값이 중복되어 들어가기 때문에, 2번 사용
+# Athena 쿼리 실행 (backoff polling, 실패/취소/시간 초과 처리, 여러 쿼리 동시 실행)
+runner = AthenaRunner(athena, 'related_artists', 's3://spotify-music-data-bucket/related_artists',
+                      poll_max=config.getfloat('ATHENA', 'poll_max', fallback=5),
+                      timeout=config.getfloat('ATHENA', 'timeout', fallback=900),
+                      read_csv=config.getboolean('ATHENA', 'read_csv', fallback=False))
 
 
 ############################
@@ -112,7 +48,7 @@ def main():
     start = time.time()
 
     # 1. top_tracks 데이터 업데이트
-    query = """
+    top_tracks_query = """
         create external table if not exists top_tracks(
         track_id string,
         artist_id string,
@@ -124,18 +60,9 @@ def main():
         ) partitioned by (dt string)
         stored as parquet location 's3://{}/top-tracks' tblproperties("parquet.compress" = "snappy")
     """.format(config['AWS']['bucket_name'])
-    r = query_athena(query, athena)
-
-    if r['ResponseMetadata']['HTTPStatusCode'] == 200:
-        query = 'msck repair table top_tracks'
-        r = query_athena(query, athena)
-        if r['ResponseMetadata']['HTTPStatusCode'] == 200:
-            result = get_query_result(r['QueryExecutionId'], athena)
-            # print(result) # 파티션 생성 결과
-            print('top_tracks partition update!')  # 신규 파티션 생성
 
     # 2. audio_features 데이터 업데이트
-    query = """
+    audio_features_query = """
         create external table if not exists audio_features(
         duration_ms int,
         key int,
@@ -154,16 +81,19 @@ def main():
         ) partitioned by (dt string)
         stored as parquet location 's3://{}/audio-features' tblproperties("parquet.compress" = "snappy")
     """.format(config['AWS']['bucket_name'])
-    r = query_athena(query, athena)
 
-    if r['ResponseMetadata']['HTTPStatusCode'] == 200:
-        query = 'msck repair table audio_features'
-        r = query_athena(query, athena)
-        if r['ResponseMetadata']['HTTPStatusCode'] == 200:
-            result = get_query_result(r['QueryExecutionId'], athena)
+    # aggregation = local 이면 Athena를 쓰지 않고 parquet 파일(S3 또는 local_source 폴더)에서 바로 계산
+    local = config.get('RELATED', 'aggregation', fallback='athena') == 'local'
+
+    # 두 테이블 생성, 두 테이블의 파티션 업데이트를 각각 동시에 실행
+    if not local:
+        runner.run_all([top_tracks_query, audio_features_query])
+        runner.run_all(['msck repair table top_tracks', 'msck repair table audio_features'])
+        print('top_tracks partition update!')  # 신규 파티션 생성
+        print('audio_features partition update!')
 
     # 3. 아티스트별 평균 수치 계산
-    query = """
+    artists_query = """
         SELECT
             artist_id,
             avg(danceability) as danceability,
@@ -183,12 +113,8 @@ def main():
             t1.artist_id
     """
 
-    r = query_athena(query, athena)
-    results = get_query_result(r['QueryExecutionId'], athena)
-    artists = process_data(results)
-
     # # 정규화 위해 수치별 최대, 최소값 계산. 가장 최근 날짜 데이터 사용
-    query = """
+    avgs_query = """
         SELECT
             MIN(danceability) AS danceability_min,
             MAX(danceability) AS danceability_max,
@@ -208,43 +134,35 @@ def main():
             dt = (select max(dt) from audio_features)
     """
 
-    r = query_athena(query, athena)
-    results = get_query_result(r['QueryExecutionId'], athena)
-    avgs = process_data(results)[0]
-
-    metrics = ['danceability', 'energy', 'loudness', 'speechiness', 'acousticness', 'instrumentalness']
-
-    for i in range(len(artists)):
-        data = []  # 일단 다 넣고, 정렬해서 최소 거리인 5개를 sql에 넣기
-
-        others = artists.copy()  # temp: 자기 자신 뺀 것.
-        mine = others.pop(i)  # mine: 자기 자신.
-        for other in others:
-            dist = 0
-            for m in metrics:
-                # mine과 other 간 거리 계산
-                x = float(mine[m])
-                x_norm = normalize(x, float(avgs[m + '_min']), float(avgs[m + '_max']))
-                y = float(other[m])
-                y_norm = normalize(y, float(avgs[m + '_min']), float(avgs[m + '_max']))
-                dist += math.sqrt((x_norm - y_norm) ** 2)
-
-            if dist != 0:
-                temp = {
-                    'artist_id': mine['artist_id'],
-                    'related_artist_id': other['artist_id'],
-                    'distance': dist
-                }
-                data.append(temp)
-
-        # 아티스트별로 가까운 5개만 MySQL에 삽입
-        # 날짜는 삽입 시점의 timestamp로 넣도록 테이블에서 설정해 놓았으므로, 신경 쓰지 않아도 됨
-        data = sorted(data, key=lambda x: x['distance'])[:5]
-        for d in data:
-            insert_row(cursor, d, 'related_artists')
-
-    conn.commit()
-    cursor.close()
+    if local:
+        table = aggregate_table(local_source(config))
+    else:
+        # 두 집계 쿼리를 동시에 실행
+        artists_id, avgs_id = runner.run_all([artists_query, avgs_query])
+        # 결과는 NextToken을 따라 모든 페이지를 읽고, 컬럼 타입(double 등)대로 변환
+        # 아티스트 id 목록 + float 행렬 + 정규화 범위로 한 번만 변환 (dict 목록은 만들지 않음)
+        avgs = next(runner.rows(avgs_id))
+        table = FeatureTable.from_rows(runner.rows(artists_id), avgs)
+
+    # 정규화된 feature 행렬은 한 번만 만듦
+    ids, features = table.ids, table.features
+
+    # 아티스트별로 가까운 5개만 MySQL에 삽입 (config.ini [RELATED] method로 정확한 계산/인덱스 검색 선택)
+    # incremental = true 이면 이전 실행 이후 바뀐 아티스트와 그 영향을 받는 아티스트만 다시 계산
+    state = None
+    if config.getboolean('RELATED', 'incremental', fallback=False):
+        previous = load_state(config.get('RELATED', 'state_path', fallback='related-state.pickle'))
+        related_data, state = incremental_related(ids, features, table.bounds, previous, config, k=5)
+    else:
+        related_data = compute_related(ids, features, config, k=5)
+
+    # 날짜는 삽입 시점의 timestamp로 넣도록 테이블에서 설정해 놓았으므로, 신경 쓰지 않아도 됨
+    # chunk 단위 multi-row upsert (swap = true 이면 shadow 테이블에 쓰고 한 번에 교체)
+    store_related(conn, related_data, config, full=state is None)
+
+    # MySQL 반영이 끝난 뒤에 스냅샷 저장
+    if state is not None:
+        save_state(state, config.get('RELATED', 'state_path', fallback='related-state.pickle'))
 
 
 if __name__ == "__main__":